@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import os
+import pandas as pd
+from cache import file_hash
+from detection import DEFAULT_BASE_THRESHOLDS, DEFAULT_REFRACTORY, DEFAULT_THRESHOLD_RANGE
+from engine import Engine, analyze
+from pipeline import PipelineConfig, manifest_matches, write_manifest
+from memory import load_averaged
+from recording import CHANNELS, PRECISIONS
+from segments import EventIndex
+
+
+def output_paths(path, out_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return {
+        "filtered": os.path.join(out_dir, f"{name}_filtered.csv"),
+        "stats": os.path.join(out_dir, f"{name}_blink-stats.csv"),
+        "events": os.path.join(out_dir, f"{name}_blink-events.npz"),
+        "manifest": os.path.join(out_dir, f"{name}_manifest.json"),
+    }
+
+
+# Filter one recording and write its filtered data and blink statistics.
+# Outputs already produced from the same input and config are reused
+# unless force is set; returns the statistics frame and whether it was reused
+async def process_recording(engine, path, out_dir, config=None, block_size=1 << 16, force=False):
+    config = config or PipelineConfig()
+    outputs = output_paths(path, out_dir)
+    name = os.path.splitext(os.path.basename(path))[0]
+    input_hash = await engine.run("load", file_hash, path)
+    if not force and manifest_matches(outputs["manifest"], input_hash, config):
+        frame = pd.read_csv(outputs["stats"])
+        frame.insert(0, "recording", name)
+        return frame, True
+
+    time, raw = await engine.run("load", load_averaged, path, config.average, config.channels, config.precision)
+    filtered = await engine.run("filter", config.apply, raw)
+    del raw
+    stats, events, joint = await analyze(engine, time, filtered, config.thresholds, config.refractory_samples(),
+                                         block_size)
+
+    def write():
+        filtered_data = pd.DataFrame({"Time (s)": time})
+        for row, channel in enumerate(config.channels):
+            filtered_data[f"{channel}_Filtered"] = filtered[row]
+        filtered_data.to_csv(outputs["filtered"], index=False)
+
+        EventIndex.from_events(events, config.channels).save(outputs["events"])
+        frame = stats.to_frame()
+        frame["coincident_blinks"] = None
+        frame.loc[frame["channel"] == "session", "coincident_blinks"] = len(joint.onset)
+        frame["input_hash"] = input_hash
+        frame["config_hash"] = config.fingerprint()
+        frame.to_csv(outputs["stats"], index=False)
+
+        # Written last, so an interrupted run is redone next time
+        write_manifest(outputs["manifest"], input_hash, config,
+                       [outputs["filtered"], outputs["stats"], outputs["events"]])
+        return frame
+
+    frame = await engine.run("write", write)
+    frame.insert(0, "recording", name)
+    return frame, False
+
+
+# Recordings run concurrently, each stage within the engine's limits;
+# results come back in the order of paths
+async def process_all(engine, paths, out_dir, config, force=False):
+    async def one(path):
+        frame, reused = await process_recording(engine, path, out_dir, config, force=force)
+        print(f"{'Up to date' if reused else 'Processed'} {path}")
+        return frame
+
+    return await asyncio.gather(*(one(path) for path in paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter recordings and export blink statistics.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--out-dir", default="batch-output")
+    parser.add_argument("--config", default=None, help="Pipeline config JSON; overrides the options below")
+    parser.add_argument("--force", action="store_true", help="Reprocess recordings whose outputs are current")
+    parser.add_argument("--jobs", type=int, default=2, help="Recordings filtered and analyzed at once")
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--cutoff", type=float, default=30)
+    parser.add_argument("--order", type=int, default=4)
+    parser.add_argument("--dc", action="store_true", help="Remove the DC shift (0.1 Hz high-pass)")
+    parser.add_argument("--notch", type=float, default=None, help="Mains notch frequency (50 or 60)")
+    parser.add_argument("--precision", choices=sorted(PRECISIONS), default=None,
+                        help="Sample precision (default: EEGAME_PRECISION or float64)")
+    parser.add_argument("--average", type=int, default=1,
+                        help="Average blocks of this many samples before filtering, as large files are shown")
+    parser.add_argument("--refractory", type=float, default=DEFAULT_REFRACTORY,
+                        help="Threshold runs closer than this (s) count as one blink")
+    parser.add_argument("--fir-transition", type=float, default=None,
+                        help="Use a linear-phase FIR low-pass with this transition width (Hz)")
+    for channel in CHANNELS:
+        parser.add_argument(f"--{channel.lower()}-base", type=float, default=DEFAULT_BASE_THRESHOLDS[channel])
+        parser.add_argument(f"--{channel.lower()}-range", type=float, default=DEFAULT_THRESHOLD_RANGE)
+    args = parser.parse_args()
+
+    if args.config:
+        config = PipelineConfig.load(args.config)
+    else:
+        thresholds = {}
+        for channel in CHANNELS:
+            base = getattr(args, f"{channel.lower()}_base")
+            range_offset = getattr(args, f"{channel.lower()}_range")
+            thresholds[channel] = (base - range_offset, base + range_offset)
+        config = PipelineConfig(args.fs, args.cutoff, args.order, args.dc, args.notch, thresholds,
+                                args.precision, args.fir_transition, average=args.average,
+                                refractory=args.refractory)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    config.save(os.path.join(args.out_dir, "config.json"))
+    print(f"Config {config.fingerprint()}")
+    engine = Engine({"filter": args.jobs, "detect": args.jobs, "stats": args.jobs})
+    try:
+        frames = asyncio.run(process_all(engine, args.paths, args.out_dir, config, args.force))
+    finally:
+        engine.shutdown()
+    pd.concat(frames).to_csv(os.path.join(args.out_dir, "summary.csv"), index=False)
+
+
+if __name__ == "__main__":
+    main()
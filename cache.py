@@ -0,0 +1,197 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "EEGAME_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "eegame")
+)
+
+_file_hashes = {}
+
+
+# SHA-256 of a file's contents, remembered per (path, size, mtime)
+def file_hash(path, chunk_size=1 << 20):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+# Bumped whenever a code change alters cached results or the classes pickled
+# on disk, so persisted entries from older versions are never returned
+CACHE_VERSION = 5
+
+
+# Content address for a result, e.g. make_key("filtered", file_hash, fs, stages)
+def make_key(*parts):
+    return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode("utf-8")).hexdigest()
+
+
+def estimate_size(value):
+    if isinstance(value, np.memmap):
+        return 0  # Paged in from its file by the OS
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def _is_mapped(value):
+    if isinstance(value, np.memmap):
+        return True
+    if isinstance(value, (tuple, list)):
+        return any(_is_mapped(item) for item in value)
+    return False
+
+
+class ResultCache:
+    """Bounded LRU cache for filtered arrays, detected events and thumbnails.
+
+    Entries live in memory up to max_bytes. Least recently used entries are
+    spilled to cache_dir, which is itself trimmed to max_disk_bytes by
+    access time. Values must be picklable; callers must not mutate them.
+    """
+
+    def __init__(self, max_bytes=256 << 20, cache_dir=DEFAULT_CACHE_DIR, max_disk_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.cache_dir is not None and os.path.exists(self._disk_path(key))
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        value = self._load(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+        self.put(key, value, spilled=True)
+        return value
+
+    def peek(self, key):
+        """Value of key if it is held in memory, else None; never reads the disk."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        return None
+
+    def put(self, key, value, spilled=False):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, spilled)
+            self._bytes += size
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, (old_value, old_size, old_spilled) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                if not old_spilled:
+                    evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            self._spill(old_key, old_value)
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated, or pickled from classes that have since changed; a miss
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # Another process may have trimmed it since it was read
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def _spill(self, key, value):
+        # Memory-mapped arrays are already on disk; pickling would copy them
+        if self.cache_dir is None or _is_mapped(value):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            # Removed by another process trimming the same directory
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
-from scipy.signal import butter, filtfilt
+from filters import ChainRunner, FilterChain, FilterExecutor
 
 # Load data
 eeg_data = pd.read_csv('eeg-data/Ecog_waveform_2.csv')
@@ -10,21 +10,6 @@ time = eeg_data['Time (s)']
 channel1 = eeg_data['FP1']
 channel2 = eeg_data['FP2']
 
-# Butterworth filter function
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    return filtfilt(b, a, data)
-
-def highpass_filter(data, cutoff, fs, order=5):
-    # Create a Butterworth high-pass filter
-    nyquist = 0.5 * fs  # Nyquist frequency
-    normal_cutoff = cutoff / nyquist  # Normalized cutoff frequency
-    b, a = butter(order, normal_cutoff, btype='high', analog=False)  # Butterworth filter coefficients
-    y = filtfilt(b, a, data)  # Apply the filter to the data
-    return y
-
 # Sampling frequency (estimated from time difference)
 fs = 250
 
@@ -36,8 +21,11 @@ fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 6))
 plt.subplots_adjust(left=0.1, bottom=0.25)
 
 
-channel_1_dcr= highpass_filter(channel1, 0.1, fs)
-channel_2_dcr=highpass_filter(channel2, 0.1, fs)
+# DC-removed signal for display; each slider update applies DC removal and
+# the low-pass together as one fused cascade
+dc_chain = FilterChain(fs).highpass(0.1, 5)
+runner = ChainRunner([channel1, channel2], fs, executor=FilterExecutor())
+channel_1_dcr, channel_2_dcr = runner.run(dc_chain)
 
 # Plot original signals only
 line1, = ax1.plot(time, channel_1_dcr, label='Original FP1', color='blue')
@@ -63,8 +51,7 @@ cutoff_slider = Slider(ax_cutoff, 'Cutoff Frequency (Hz)', 0.1, 50.0, valinit=in
 # Update function for slider
 def update(val):
     cutoff = cutoff_slider.val
-    filtered_channel1 = butter_lowpass_filter(channel_1_dcr, cutoff, fs)
-    filtered_channel2 = butter_lowpass_filter(channel_2_dcr, cutoff, fs)
+    filtered_channel1, filtered_channel2 = runner.run(dc_chain.lowpass(cutoff, 5))
     
     # Set the filtered data to the new lines
     line1_f.set_ydata(filtered_channel1)
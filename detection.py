@@ -0,0 +1,157 @@
+from collections import namedtuple
+import numpy as np
+from kernels import detect, threshold_mask
+
+
+# Indices of samples detected as blinks
+def detect_blinks(data, lower, upper, out=None, scratch=None):
+    return np.flatnonzero(threshold_mask(data, lower, upper, out=out, scratch=scratch))
+
+
+# Default base thresholds and ± range used by Stage 2 and batch runs
+DEFAULT_BASE_THRESHOLDS = {"FP1": 8500, "FP2": -8400}
+DEFAULT_THRESHOLD_RANGE = 100
+
+
+def threshold_range(channel, base_thresholds=None, range_offset=DEFAULT_THRESHOLD_RANGE):
+    base = (base_thresholds or DEFAULT_BASE_THRESHOLDS)[channel]
+    return base - range_offset, base + range_offset
+
+
+# Threshold runs closer than this (seconds) are one blink: a blink that
+# chatters around a threshold crosses it several times
+DEFAULT_REFRACTORY = 0.2
+
+
+def refractory_samples(refractory, fs):
+    return int(round(refractory * fs))
+
+
+class StreamingDetector:
+    """Turns threshold crossings into events across consecutive blocks.
+
+    An event is a run of samples outside [lower, upper]; runs separated by
+    fewer than refractory samples are merged into one event, also across
+    block edges. The last event of a block stays pending until a later
+    block shows it cannot grow (or finish() closes it). Each event reports
+    onset and offset times and its peak deviation from the middle of the
+    threshold band.
+    """
+
+    def __init__(self, lower, upper, refractory=0):
+        self.lower = lower
+        self.upper = upper
+        self.refractory = refractory
+        self.center = 0.5 * (lower + upper)
+        self._position = 0  # Samples fed so far
+        self._pending = None  # [onset, peak, last_time, end sample]
+
+    def feed(self, time, data):
+        """Return (onsets, offsets, peaks) of events closed in this block."""
+        time = np.asarray(time)
+        data = np.asarray(data)
+        empty = (np.empty(0), np.empty(0), np.empty(0))
+        if len(data) == 0:
+            return empty
+        # Runs of this block, already merged within it; the first one may
+        # continue the pending event of earlier blocks. A gap of zero is a run
+        # split by the block edge, merged even without a refractory period
+        starts, ends, peak_rows = detect(data, self.lower, self.upper, self.refractory)
+        deviations = np.abs(data[peak_rows] - self.center)
+        position = self._position
+        self._position += len(data)
+        merge_gap = max(self.refractory, 1)
+
+        closed = []
+        if self._pending is not None and len(starts) and position + starts[0] - self._pending[3] < merge_gap:
+            self._pending[1] = max(self._pending[1], deviations[0])
+            self._pending[2] = time[ends[0] - 1]
+            self._pending[3] = position + ends[0]
+            starts, ends, deviations = starts[1:], ends[1:], deviations[1:]
+        if self._pending is not None and len(starts):
+            closed.append(self._pending)
+            self._pending = None
+
+        if len(starts):
+            self._pending = [time[starts[-1]], deviations[-1], time[ends[-1] - 1], position + ends[-1]]
+            starts, ends, deviations = starts[:-1], ends[:-1], deviations[:-1]
+        if self._pending is not None and self._position - self._pending[3] >= merge_gap:
+            tail = self._pending
+            self._pending = None
+        else:
+            tail = None
+
+        onsets = [[event[0] for event in closed], time[starts]]
+        offsets = [[event[2] for event in closed], time[ends - 1]]
+        peaks = [[event[1] for event in closed], deviations]
+        if tail is not None:
+            onsets.append([tail[0]])
+            offsets.append([tail[2]])
+            peaks.append([tail[1]])
+        return (np.concatenate(onsets).astype(np.float64),
+                np.concatenate(offsets).astype(np.float64),
+                np.concatenate(peaks).astype(np.float64))
+
+    def finish(self):
+        """Close an event still pending at the end of the recording."""
+        if self._pending is None:
+            return np.empty(0), np.empty(0), np.empty(0)
+        onset, peak, last_time, _ = self._pending
+        self._pending = None
+        return np.array([onset]), np.array([last_time]), np.array([peak])
+
+
+# (onsets, offsets, peaks) of every event in a whole recording
+def detect_events(time, data, lower, upper, refractory=0):
+    detector = StreamingDetector(lower, upper, refractory)
+    closed = detector.feed(time, data)
+    last = detector.finish()
+    return tuple(np.concatenate([a, b]) for a, b in zip(closed, last))
+
+
+# Joint events seen on both channels within the tolerance window
+Coincidences = namedtuple("Coincidences", ["onset", "offset", "index_a", "index_b", "latency_a", "latency_b"])
+
+COINCIDENCE_TOLERANCE = 0.05  # seconds
+
+
+def coincident_events(events_a, events_b, tolerance=COINCIDENCE_TOLERANCE):
+    """Join two channels' event intervals in O(n log n).
+
+    events_a and events_b are (onsets, offsets, ...) with non-overlapping
+    events sorted by onset, as produced by detect_events. Two events
+    coincide when their intervals, widened by tolerance, overlap. Each event
+    of a pairs with the overlapping event of b whose onset is nearest, and
+    each event of b is used at most once. Latencies are each channel's onset
+    relative to the joint onset.
+    """
+    on_a, off_a = np.asarray(events_a[0]), np.asarray(events_a[1])
+    on_b, off_b = np.asarray(events_b[0]), np.asarray(events_b[1])
+    if not len(on_a) or not len(on_b):
+        empty = np.empty(0)
+        index = np.empty(0, dtype=np.intp)
+        return Coincidences(empty, empty, index, index, empty, empty)
+
+    # Candidates in b for each a event form a contiguous run [lo, hi)
+    lo = np.searchsorted(off_b, on_a - tolerance, side="left")
+    hi = np.searchsorted(on_b, off_a + tolerance, side="right")
+    has_match = lo < hi
+
+    # Nearest onset within the run: the neighbours either side of on_a
+    k = np.searchsorted(on_b, on_a)
+    right = np.clip(k, lo, np.maximum(hi - 1, lo))
+    left = np.clip(k - 1, lo, np.maximum(hi - 1, lo))
+    right = np.minimum(right, len(on_b) - 1)
+    left = np.minimum(left, len(on_b) - 1)
+    nearest = np.where(np.abs(on_b[left] - on_a) <= np.abs(on_b[right] - on_a), left, right)
+
+    index_a = np.flatnonzero(has_match)
+    index_b = nearest[has_match]
+    # Keep the first a event for any b event matched twice
+    index_b, first = np.unique(index_b, return_index=True)
+    index_a = index_a[first]
+
+    onset = np.minimum(on_a[index_a], on_b[index_b])
+    offset = np.maximum(off_a[index_a], off_b[index_b])
+    return Coincidences(onset, offset, index_a, index_b,
+                        on_a[index_a] - onset, on_b[index_b] - onset)
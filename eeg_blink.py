@@ -1,30 +1,38 @@
+import asyncio
 import sys
+import threading
+from functools import partial
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.signal import butter, filtfilt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import (
-    QApplication, QVBoxLayout, QHBoxLayout, QSlider, QWidget, QLabel, QLineEdit, QPushButton, QStackedWidget, QFileDialog, QDateEdit
+    QApplication, QVBoxLayout, QHBoxLayout, QSlider, QWidget, QLabel, QLineEdit, QPushButton, QStackedWidget, QFileDialog, QDateEdit,
+    QCheckBox, QComboBox, QProgressBar
 )
-from PyQt5.QtCore import Qt, QDate
-from PyQt5.QtGui import QPixmap
-
+from PyQt5.QtCore import Qt, QDate, QSize, QTimer
+from PyQt5.QtGui import QIcon, QPixmap
+from cache import ResultCache, make_key
+from detection import (
+    COINCIDENCE_TOLERANCE, DEFAULT_BASE_THRESHOLDS, DEFAULT_THRESHOLD_RANGE, detect_blinks
+)
+from engine import Bridge, Engine
+from figures import draw_stage1, draw_stage2_channel, new_figure
+from filters import ChainRunner, FilterExecutor, max_cutoff, standard_chain
+from memory import cache_budget, default_budget
+from pipeline import PipelineConfig, image_metadata, manifest_matches, write_manifest
+from recording import CHANNELS, preview_recording, recording_arrays
+from segments import EventIndex
+from stats import SessionStats, iter_blocks
+from traces import minmax_decimate
+from workspace import VISIBLE, Workspace
 
-# Butterworth low-pass filter
-def low_pass_filter(data, cutoff, fs, order=4):
-    nyquist = 0.5 * fs
-    normal_cutoff = cutoff / nyquist
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    filtered_data = filtfilt(b, a, data)
-    return filtered_data
 
 # Intro Screen
 class IntroScreen(QWidget):
     def __init__(self, stacked_widget):
         super().__init__()
         self.stacked_widget = stacked_widget
-        self.file_path = None  # Placeholder for selected file
+        self.file_paths = []  # Placeholder for selected files
         self.init_ui()
         self.resize(300,400)
 
@@ -61,10 +69,10 @@ class IntroScreen(QWidget):
 
         # File Input
         file_layout = QHBoxLayout()
-        file_label = QLabel("CSV File:")
+        file_label = QLabel("CSV Files:")
         self.file_button = QPushButton("Browse")
         self.file_button.clicked.connect(self.browse_file)
-        self.file_feedback = QLabel("No file selected")
+        self.file_feedback = QLabel("No files selected")
         file_layout.addWidget(file_label)
         file_layout.addWidget(self.file_button)
         layout.addLayout(file_layout)
@@ -80,62 +88,99 @@ class IntroScreen(QWidget):
 
     def browse_file(self):
         file_dialog = QFileDialog()
-        file_path, _ = file_dialog.getOpenFileName(self, "Select CSV File", "", "CSV Files (*.csv)")
-        if file_path:
-            self.file_path = file_path
-            self.file_feedback.setText(file_path)
+        file_paths, _ = file_dialog.getOpenFileNames(self, "Select CSV Files", "", "EEG Recordings (*.csv *.eegz)")
+        if file_paths:
+            self.file_paths = file_paths
+            self.file_feedback.setText(file_paths[0] if len(file_paths) == 1 else f"{len(file_paths)} files selected")
             self.validate_inputs()
 
     def validate_inputs(self):
         name_filled = bool(self.name_input.text().strip())
         date_filled = bool(self.date_input.text().strip())
-        file_selected = bool(self.file_path)
+        file_selected = bool(self.file_paths)
         self.start_button.setEnabled(name_filled and date_filled and file_selected)
 
     def start_main_app(self):
         # Pass user inputs to the next stage
         main_app = self.stacked_widget.widget(1)
-        main_app.file_path = self.file_path
-
-        # Load the data into Stage1
-        eeg_data = pd.read_csv(self.file_path)
-        main_app.stage1.eeg_data = eeg_data
-        main_app.stage1.time = eeg_data["Time (s)"]
-        main_app.stage1.fs = 256  # Assumed sampling frequency
-        main_app.stage1.update_plot()
+        main_app.file_path = self.file_paths[0]
         main_app.stage1.user_name = self.name_input.text().strip()
         main_app.stage1.user_date = self.date_input.text().strip()
 
+        # Files load, filter and render in the background; Stage1 shows the first one as soon as it is read
+        main_app.open_files(self.file_paths)
+
         # Switch to the main app
         self.stacked_widget.resize(1200, 900)
         self.stacked_widget.setCurrentIndex(1)
 
 class Stage1(QWidget):
-    def __init__(self, eeg_data, time, fs, user_name, user_date, stacked_widget):
+    def __init__(self, eeg_data, time, fs, user_name, user_date, stacked_widget, cache=None, workspace=None):
         super().__init__()
-        self.eeg_data = eeg_data
-        self.time = time
+        self.time = None
         self.fs = fs
+        self.average = 1  # Samples averaged into each one shown, for large recordings
         self.cutoff = 30  # Default cutoff frequency
-        self.filtered_data = None
+        self.raw = None
+        self.filtered = None
+        self.filtered_result = None  # Result copied into filtered; never written, so Stage 2 can share it
+        self.lines = None
+        self.executor = FilterExecutor()
+        self.runner = None
+        self.cache = cache if cache is not None else ResultCache()
+        self.source_key = None
+        self.filtered_key = None
+        self.filter_job = None  # Background filtering for the current view, if any
+        self.filter_job_key = None
+        self.runner_lock = threading.Lock()
+        self.preview_points = 2000
+        self.workspace = workspace if workspace is not None else Workspace(fs=fs or 256, cache=self.cache)
+        self.file_index = None  # File shown, or waiting to be shown once loaded
+        self.file_icons = set()
         self.user_name = user_name
         self.user_date = user_date
         self.stacked_widget = stacked_widget
 
+        # Polls the workspace while background work is running
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(100)
+        self.poll_timer.timeout.connect(self.poll_workspace)
+
         self.init_ui()
         self.resize(1200,900)
+        if eeg_data is not None:
+            self.load_data(*recording_arrays(eeg_data), fs)
 
     def init_ui(self):
         layout = QVBoxLayout()
 
+        # Open recordings and background progress
+        files_layout = QHBoxLayout()
+        files_layout.addWidget(QLabel("Recording:"))
+        self.file_combo = QComboBox()
+        self.file_combo.setIconSize(QSize(96, 48))
+        self.file_combo.currentIndexChanged.connect(self.show_file)
+        files_layout.addWidget(self.file_combo, 1)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        files_layout.addWidget(self.progress_bar)
+        self.cancel_button = QPushButton("Cancel Background Work")
+        self.cancel_button.clicked.connect(self.cancel_background)
+        files_layout.addWidget(self.cancel_button)
+        layout.addLayout(files_layout)
+
+        # How a large recording was loaded to stay within the memory budget
+        self.memory_label = QLabel("")
+        self.memory_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.memory_label)
+
         # Cutoff Frequency Label
         self.label = QLabel(f"Current Cutoff Frequency: {self.cutoff} Hz")
         self.label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.label)
 
         # Matplotlib Figure
-        self.figure, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(8, 8))
-        self.figure.tight_layout(pad=3)
+        self.figure, (self.ax1, self.ax2) = new_figure(figsize=(8, 8))
         self.canvas = FigureCanvas(self.figure)
         layout.addWidget(self.canvas)
 
@@ -160,6 +205,19 @@ class Stage1(QWidget):
         slider_label_layout.addWidget(QLabel("50Hz"))  # End label
         layout.addLayout(slider_label_layout)
 
+        # Optional DC removal and mains notch, applied before the low-pass
+        options_layout = QHBoxLayout()
+        self.dc_checkbox = QCheckBox("Remove DC Shift (0.1 Hz high-pass)")
+        self.dc_checkbox.stateChanged.connect(self.update_plot)
+        options_layout.addWidget(self.dc_checkbox)
+        options_layout.addStretch()
+        options_layout.addWidget(QLabel("Mains Notch:"))
+        self.notch_combo = QComboBox()
+        self.notch_combo.addItems(["Off", "50 Hz", "60 Hz"])
+        self.notch_combo.currentIndexChanged.connect(self.update_plot)
+        options_layout.addWidget(self.notch_combo)
+        layout.addLayout(options_layout)
+
         # Buttons
         button_layout = QHBoxLayout()
         self.feedback_label = QLabel("")
@@ -179,75 +237,286 @@ class Stage1(QWidget):
         layout.addWidget(self.feedback_label)
 
         self.setLayout(layout)
-        if self.eeg_data is not None :
-            self.update_plot()
+
+    def load_data(self, time, raw, fs, source_key=None, average=1):
+        self.fs = fs
+        self.average = average
+        self.source_key = source_key
+
+        # Raw channels and filter output live in fixed buffers reused by every update
+        self.cancel_filter()
+        self.time = time
+        self.raw = raw
+        self.filtered = np.empty_like(self.raw)
+        self.filtered_result = None
+        self.filtered_key = None
+        # Results are kept by the cache, within its share of the memory budget
+        self.runner = ChainRunner(self.raw, fs, executor=self.executor, max_results=0)
+
+        # Averaged recordings have a lower Nyquist frequency
+        self.slider.blockSignals(True)
+        self.slider.setMaximum(max_cutoff(fs))
+        self.slider.blockSignals(False)
+
+        # Decimated raw first; the filtered full-resolution view replaces it when ready
+        self.draw_preview(*minmax_decimate(time, raw, self.preview_points))
+        self.update_plot()
+
+    def draw_preview(self, time, raw):
+        self.lines = None
+        draw_stage1((self.ax1, self.ax2), time, raw)
+        for ax, channel in zip((self.ax1, self.ax2), CHANNELS):
+            ax.set_title(f"Channel {channel} (preview)")
+        self.canvas.draw_idle()
+
+    def set_files(self, paths):
+        self.workspace.add(paths)
+        self.file_combo.blockSignals(True)
+        for entry in self.workspace.files[self.file_combo.count():]:
+            self.file_combo.addItem(entry.name)
+        self.file_combo.blockSignals(False)
+        self.poll_timer.start()
+
+    def show_file(self, index):
+        # The file's work jumps to the front of the queue; it is drawn once loaded
+        if index < 0:
+            return
+        self.file_combo.blockSignals(True)
+        self.file_combo.setCurrentIndex(index)
+        self.file_combo.blockSignals(False)
+        self.workspace.focus(index)
+        self.file_index = index
+        entry = self.workspace.files[index]
+        self.feedback_label.setText(f"Loading {entry.name}...")
+
+        # Sampled rows take milliseconds to read, so something shows while the file parses
+        if self.workspace.recording(index) is None:
+            self.raw = None
+            self.cancel_filter()
+            try:
+                self.draw_preview(*preview_recording(entry.path, self.preview_points))
+            except (OSError, ValueError):
+                pass
+        self.poll_timer.start()
+        self.poll_workspace()
+
+    def poll_workspace(self):
+        # Checked first so the texts below are never older than the decision to stop
+        all_finished = all(entry.finished for entry in self.workspace.files)
+        for index, entry in enumerate(self.workspace.files):
+            self.file_combo.setItemText(index, f"{entry.name} ({entry.status()})")
+            if entry.thumbnail is not None and index not in self.file_icons:
+                pixmap = QPixmap()
+                pixmap.loadFromData(entry.thumbnail, "PNG")
+                self.file_combo.setItemIcon(index, QIcon(pixmap))
+                self.file_icons.add(index)
+        self.progress_bar.setValue(int(100 * self.workspace.progress()))
+
+        if self.file_index is not None and self.file_index == self.workspace.current:
+            entry = self.workspace.files[self.file_index]
+            if entry.error is not None:
+                self.feedback_label.setText(f"Could not open {entry.name}: {entry.error}")
+                self.file_index = None
+            else:
+                recording = self.workspace.recording(self.file_index)
+                if recording is not None:
+                    time, raw, source_key, fs = recording
+                    self.file_index = None
+                    self.feedback_label.setText("")
+                    self.memory_label.setText(self.memory_note(entry.plan))
+                    self.load_data(time, raw, fs, source_key, entry.plan.factor)
+
+        job = self.filter_job
+        if job is not None and job.finished:
+            self.filter_job = None
+            if job.state == "done":
+                self.show_filtered(job.result, self.filter_job_key)
+            elif job.state == "failed":
+                self.feedback_label.setText(f"Filtering failed: {job.error}")
+
+        if self.file_index is None and self.filter_job is None and all_finished:
+            self.poll_timer.stop()
+
+    def memory_note(self, plan):
+        budget = f"{plan.budget / 2 ** 20:.0f} MB"
+        if plan.strategy == "mmap":
+            return f"Large recording: samples are memory-mapped to fit the {budget} left of the memory budget."
+        if plan.strategy == "chunked":
+            return (f"Large recording: showing means of {plan.factor} samples "
+                    f"({self.workspace.fs / plan.factor:g} Hz) to fit the {budget} left of the memory budget.")
+        return ""
+
+    def cancel_background(self):
+        self.workspace.cancel()
+        self.poll_workspace()
+
+    def filter_chain(self):
+        return standard_chain(
+            self.fs,
+            self.cutoff,
+            dc_removal=self.dc_checkbox.isChecked(),
+            notch=self.notch_frequency(),
+        )
+
+    # Mains notch, if selected and below the Nyquist frequency
+    def notch_frequency(self):
+        notch = self.notch_combo.currentText()
+        if notch == "Off" or int(notch.split()[0]) >= self.fs / 2:
+            return None
+        return int(notch.split()[0])
+
+    # Settings behind the current view, recorded with every export: the
+    # stages actually applied and how many samples were averaged into one
+    def pipeline_config(self):
+        return PipelineConfig.from_chain(self.filter_chain(), self.average,
+                                         precision=None if self.raw is None else self.raw.dtype.name)
+
+    def init_plot(self):
+        self.lines = draw_stage1((self.ax1, self.ax2), self.time, self.raw, self.filtered)
 
     def update_plot(self):
         self.cutoff = self.slider.value()
         self.label.setText(f"Current Cutoff Frequency: {self.cutoff} Hz")
 
-        # Apply low-pass filter
-        filtered_fp1 = low_pass_filter(self.eeg_data['FP1'], self.cutoff, self.fs)
-        filtered_fp2 = low_pass_filter(self.eeg_data['FP2'], self.cutoff, self.fs)
-
-        # Save filtered data for export
-        self.filtered_data = pd.DataFrame({
-            'Time (s)': self.time,
-            'FP1_Filtered': filtered_fp1,
-            'FP2_Filtered': filtered_fp2
-        })
-
-        # Clear and redraw plots
-        self.ax1.clear()
-        self.ax2.clear()
+        if self.raw is None:
+            return
 
-        self.ax1.plot(self.time, self.eeg_data['FP1'], label="Raw FP1", alpha=0.5)
-        self.ax1.plot(self.time, filtered_fp1, label="Filtered FP1", alpha=0.8)
-        self.ax1.set_title("Channel FP1")
-        self.ax1.set_ylabel("Amplitude (μV)")
-        self.ax1.legend()
-        self.ax1.grid(True)
-
-        self.ax2.plot(self.time, self.eeg_data['FP2'], label="Raw FP2", alpha=0.5)
-        self.ax2.plot(self.time, filtered_fp2, label="Filtered FP2", alpha=0.8)
-        self.ax2.set_title("Channel FP2")
-        self.ax2.set_xlabel("Time (s)")
-        self.ax2.set_ylabel("Amplitude (μV)")
-        self.ax2.legend()
-        self.ax2.grid(True)
+        # Reuse an earlier result held in memory for the same file and chain;
+        # otherwise the background job reads it from disk or filters. A newer
+        # chain supersedes a request still pending
+        chain = self.filter_chain()
+        key = None
+        if self.source_key is not None:
+            key = make_key("filtered", self.source_key, self.raw.dtype.name, self.fs, chain.stages)
+        self.cancel_filter()
+        cached = self.cache.peek(key) if key else None
+        if cached is not None:
+            self.show_filtered(cached, key)
+            return
 
-        self.canvas.draw()
+        runner, cache, lock = self.runner, self.cache, self.runner_lock
+
+        def filter_view():
+            with lock:
+                return runner.run(chain)
+
+        def run():
+            return cache.get_or_compute(key, filter_view) if key else filter_view()
+
+        self.filter_job = self.workspace.queue.submit(run, VISIBLE, group=self, name="filter view")
+        self.filter_job_key = key
+        self.feedback_label.setText("Filtering...")
+        self.poll_timer.start()
+
+    def cancel_filter(self):
+        # A job already running finishes, but its result is ignored
+        if self.filter_job is not None:
+            self.workspace.queue.cancel(self)
+            self.filter_job = None
+
+    def show_filtered(self, filtered, key):
+        np.copyto(self.filtered, filtered)
+        self.filtered_result = filtered
+        self.filtered_key = key
+        self.feedback_label.setText("")
+
+        # Only the filtered lines change with the cutoff
+        if self.lines is None:
+            self.init_plot()
+        else:
+            self.lines[0].set_ydata(self.filtered[0])
+            self.lines[1].set_ydata(self.filtered[1])
+            for ax in (self.ax1, self.ax2):
+                ax.relim()
+                ax.autoscale_view()
+
+        self.canvas.draw_idle()
+
+    def filtering(self):
+        if self.filter_job is not None or self.lines is None:
+            self.feedback_label.setText("Filtering in progress, please wait.")
+            return True
+        return False
 
     def export_data(self):
-        if self.filtered_data is not None:
-            self.filtered_data.to_csv("filtered_data.csv", index=False)
+        if self.filtered is not None and not self.filtering():
+            # Skipped when the same file was already exported with the same settings
+            config = self.pipeline_config()
+            manifest = "filtered_data_manifest.json"
+            if self.source_key is not None and manifest_matches(manifest, self.source_key, config):
+                self.feedback_label.setText("'filtered_data.csv' is already up to date.")
+                return
+            # The DataFrame is only built at the export boundary
+            filtered_data = pd.DataFrame({
+                'Time (s)': self.time,
+                'FP1_Filtered': self.filtered[0],
+                'FP2_Filtered': self.filtered[1]
+            })
+            filtered_data.to_csv("filtered_data.csv", index=False)
+            write_manifest(manifest, self.source_key, config, ["filtered_data.csv"])
             self.feedback_label.setText("Filtered data saved to 'filtered_data.csv'.")
 
     def export_image(self):
         file_name = self.user_name+"_"+self.user_date+"_"+"stage-1.png"
         file_name = file_name.replace("/","_")
-        self.figure.savefig(file_name)
+        self.figure.savefig(file_name, metadata=image_metadata(self.pipeline_config(), self.source_key))
         self.feedback_label.setText(f'Image saved to "{file_name}".')
 
     def goto_stage2(self):
+        if self.filtering():
+            return
         stage2 = self.stacked_widget.widget(1)
-        stage2.load_data(self.filtered_data)
+        # Settings first: Stage 2 looks for a saved index of the same session
+        stage2.config = self.pipeline_config()
+        stage2.source_key = self.source_key
         stage2.user_name = self.user_name
         stage2.user_date = self.user_date
+        # The result, not the buffer: later slider steps overwrite the buffer
+        # while Stage 2 may still be analyzing
+        stage2.load_data(self.time, self.filtered_result, self.filtered_key)
         self.stacked_widget.setCurrentIndex(1)
 
 
+# Event index of an earlier export, if its manifest records the same input
+# and config; None otherwise
+def read_saved_index(manifest, events_name, input_hash, config):
+    if not manifest_matches(manifest, input_hash, config):
+        return None
+    try:
+        return EventIndex.load(events_name)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
 class Stage2(QWidget):
-    def __init__(self, stacked_widget):
+    def __init__(self, stacked_widget, cache=None, engine=None):
         super().__init__()
-        self.filtered_data = None
+        self.time = None
+        self.filtered = None
+        self.data_key = None
+        self.cache = cache if cache is not None else ResultCache()
+        self.engine = engine if engine is not None else Engine()
         self.stacked_widget = stacked_widget
         self.user_name = None
         self.user_date = None
 
         # Threshold defaults
-        self.base_thresholds = {"FP1": 8500, "FP2": -8400}
-        self.slider_values = {"FP1": 100, "FP2": 100}
+        self.base_thresholds = dict(DEFAULT_BASE_THRESHOLDS)
+        self.slider_values = {"FP1": DEFAULT_THRESHOLD_RANGE, "FP2": DEFAULT_THRESHOLD_RANGE}
+        self.stats = None
+        self.event_index = None
+        self.analyzed_thresholds = None  # Thresholds of the last analysis drawn
+        self.config = None  # Stage1's settings; the thresholds come from here
+        self.source_key = None
+        self.view_width = 5.0  # Seconds shown when jumping to a blink
+        self.view_epsilon = 1e-6  # Views centred on a blink are off by rounding; well under one sample
+
+        # Detection runs on the engine; results come back through the bridge,
+        # drained on the GUI thread while any are outstanding
+        self.bridge = Bridge()
+        self.bridge_timer = QTimer(self)
+        self.bridge_timer.setInterval(20)
+        self.bridge_timer.timeout.connect(self.drain_results)
 
         self.init_ui()
         self.resize(1200,900)
@@ -256,8 +525,7 @@ class Stage2(QWidget):
         layout = QVBoxLayout()
 
         # Matplotlib Figure
-        self.figure, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(8, 8))
-        self.figure.tight_layout(pad=3)
+        self.figure, (self.ax1, self.ax2) = new_figure(figsize=(8, 8))
         self.canvas = FigureCanvas(self.figure)
         layout.addWidget(self.canvas)
 
@@ -267,6 +535,26 @@ class Stage2(QWidget):
         self.add_channel_controls(slider_layout, "FP2")
         layout.addLayout(slider_layout)
 
+        # Jump-to-blink navigation; only the view limits change
+        nav_layout = QHBoxLayout()
+        for text, handler in (
+            ("Previous Blink", self.goto_previous_blink),
+            ("Next Blink", self.goto_next_blink),
+            ("Densest Minute", self.goto_densest_minute),
+            ("Show All", self.show_all),
+        ):
+            button = QPushButton(text)
+            button.clicked.connect(handler)
+            nav_layout.addWidget(button)
+        self.nav_label = QLabel("")
+        nav_layout.addWidget(self.nav_label)
+        layout.addLayout(nav_layout)
+
+        # Blink Statistics
+        self.stats_label = QLabel("")
+        self.stats_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.stats_label)
+
         # Buttons
         button_layout = QHBoxLayout()
         self.feedback_label = QLabel("")
@@ -274,8 +562,11 @@ class Stage2(QWidget):
         back_button.clicked.connect(self.goto_stage1)
         image_button = QPushButton("Save Image")
         image_button.clicked.connect(self.export_image)
+        stats_button = QPushButton("Export Statistics")
+        stats_button.clicked.connect(self.export_stats)
         button_layout.addWidget(back_button)
         button_layout.addWidget(image_button)
+        button_layout.addWidget(stats_button)
         layout.addLayout(button_layout)
 
         # Feedback Label for Export
@@ -311,8 +602,25 @@ class Stage2(QWidget):
 
         layout.addLayout(controls_layout)
 
-    def load_data(self, filtered_data):
-        self.filtered_data = filtered_data
+    def load_data(self, time, filtered, data_key=None):
+        # Coming back with the same filtered data: the plot is already current
+        if data_key is not None and data_key == self.data_key:
+            return
+        self.data_key = data_key
+
+        # Results of the previous data must not outlive it; navigation and
+        # export wait for this data's analysis
+        self.engine.cancel(self)
+        self.engine.cancel((self, "saved"))
+        self.stats = None
+        self.event_index = None
+        self.analyzed_thresholds = None
+        self.nav_label.setText("")
+
+        # Stage1's time and filtered result, neither written again; only the
+        # masks are owned here
+        self.time = time
+        self.filtered = filtered
         self.update_plot()
 
     def update_base_threshold(self, channel, input_widget):
@@ -328,38 +636,131 @@ class Stage2(QWidget):
         self.update_plot()
 
     def update_plot(self):
-        if self.filtered_data is None:
+        if self.filtered is None:
+            return
+
+        # An index exported earlier with the same data and settings allows
+        # navigation before detection finishes; it is read on the engine
+        config = self.pipeline_config()
+        if self.source_key is not None and self.user_name is not None and self.user_date is not None:
+            _, events_name, manifest = self.export_names()
+            read = self.engine.run("load", read_saved_index, manifest, events_name, self.source_key, config)
+            self.engine.submit(read, key=(self, "saved"),
+                               callback=partial(self.show_saved_index, self.data_key, config), bridge=self.bridge)
+
+        # A newer request supersedes one still pending; the plot keeps showing
+        # the last finished result until this one arrives
+        self.stats_label.setText("Detecting blinks...")
+        self.engine.submit(self.analyze(self.time, self.filtered, self.data_key, config.thresholds,
+                                        config.refractory_samples()),
+                           key=self, callback=self.show_analysis, bridge=self.bridge)
+        self.bridge_timer.start()
+
+    async def analyze(self, time, filtered, data_key, thresholds, refractory):
+        # Runs on the engine's loop; every step is cached per filtered data and settings
+        engine, cache = self.engine, self.cache
+
+        def cached(key, compute):
+            return compute() if data_key is None else cache.get_or_compute(make_key(*key), compute)
+
+        # One statistics pass yields the events; the joint events and the index
+        # are merged from those rather than rescanning the samples
+        masks = [engine.run("detect", cached, ("events", data_key, row, *thresholds[channel]),
+                            partial(detect_blinks, filtered[row], *thresholds[channel]))
+                 for row, channel in enumerate(CHANNELS)]
+        stats = engine.run("stats", cached, ("stats", data_key, thresholds, refractory),
+                           lambda: SessionStats(thresholds, refractory).feed_blocks(iter_blocks(time, filtered)))
+        *masks, stats = await asyncio.gather(*masks, stats)
+        joint = stats.coincidences()
+        index = EventIndex.from_events(stats.events(), CHANNELS)
+        return data_key, thresholds, masks, stats, joint, index
+
+    def drain_results(self):
+        self.bridge.drain()
+        if not self.bridge.busy:
+            self.bridge_timer.stop()
+
+    def show_analysis(self, future):
+        if future.cancelled():
             return
+        if future.exception() is not None:
+            self.stats_label.setText(f"Detection failed: {future.exception()}")
+            return
+        data_key, thresholds, masks, stats, joint, index = future.result()
+        # Analysis of data replaced since it was requested
+        if data_key != self.data_key:
+            return
+        self.stats, self.event_index = stats, index
+        self.analyzed_thresholds = thresholds
 
         self.ax1.clear()
         self.ax2.clear()
+        for ax, row, channel in ((self.ax1, 0, "FP1"), (self.ax2, 1, "FP2")):
+            lower, upper = thresholds[channel]
+            draw_stage2_channel(ax, self.time, self.filtered[row], masks[row], lower, upper, channel)
+        self.nav_label.setText(f"{len(self.event_index)} blinks indexed")
+
+        lines = []
+        for channel, summary in self.stats.summary()["channels"].items():
+            lines.append(
+                f"{channel}: {summary['blinks']} blinks, {summary['blinks_per_min']:.1f}/min, "
+                f"mean inter-blink interval {summary['ibi_mean_s']:.2f} s, "
+                f"median peak {summary['peak_p50']:.0f} μV"
+            )
+        lines.append(
+            f"Coincident blinks on both channels (±{1000 * COINCIDENCE_TOLERANCE:.0f} ms): {len(joint.onset)}"
+        )
+        self.stats_label.setText("\n".join(lines))
+        self.canvas.draw()
 
-        # Process FP1
-        self.plot_channel(self.ax1, "FP1_Filtered", "FP1")
+    def thresholds(self):
+        thresholds = {}
+        for channel in CHANNELS:
+            base = self.base_thresholds[channel]
+            range_offset = self.slider_values[channel]
+            thresholds[channel] = (base - range_offset, base + range_offset)
+        return thresholds
+
+    def pipeline_config(self):
+        return (self.config or PipelineConfig()).replace(thresholds=self.thresholds())
+
+    def view_center(self):
+        lo, hi = self.ax1.get_xlim()
+        return 0.5 * (lo + hi)
+
+    def set_view(self, t0, t1, text):
+        for ax in (self.ax1, self.ax2):
+            ax.set_xlim(t0, t1)
+        self.nav_label.setText(text)
+        self.canvas.draw_idle()
+
+    def goto_event(self, i):
+        if i is None or self.event_index is None:
+            return
+        onset = self.event_index.onsets[i]
+        channel = self.event_index.channels[self.event_index.channel[i]]
+        self.set_view(onset - 0.5 * self.view_width, onset + 0.5 * self.view_width,
+                      f"Blink {i + 1}/{len(self.event_index)} ({channel}) at {onset:.2f} s")
 
-        # Process FP2
-        self.plot_channel(self.ax2, "FP2_Filtered", "FP2")
+    def goto_next_blink(self):
+        if self.event_index is not None:
+            self.goto_event(self.event_index.next_event(self.view_center() + self.view_epsilon))
 
-        self.canvas.draw()
+    def goto_previous_blink(self):
+        if self.event_index is not None:
+            self.goto_event(self.event_index.previous_event(self.view_center() - self.view_epsilon))
+
+    def goto_densest_minute(self):
+        if self.event_index is None:
+            return
+        start, count = self.event_index.densest(60.0)
+        if start is not None:
+            self.set_view(start, start + 60.0, f"Densest minute: {count} blinks from {start:.2f} s")
 
-    def plot_channel(self, ax, column, channel):
-        base = self.base_thresholds[channel]
-        range_offset = self.slider_values[channel]
-        upper, lower = base + range_offset, base - range_offset
-        data = self.filtered_data[column]
-        time = self.filtered_data["Time (s)"]
-
-        # Blink Detection
-        blink_mask = (data > upper) | (data < lower)
-
-        # Plot Data
-        ax.plot(time, data, label=f"{channel} Filtered", alpha=0.8)
-        ax.scatter(time[blink_mask], data[blink_mask], color="red", label="Detected Blinks", zorder=5)
-        ax.axhline(upper, color="green", linestyle="--", label=f"Upper Threshold ({upper} μV)")
-        ax.axhline(lower, color="green", linestyle="--", label=f"Lower Threshold ({lower} μV)")
-        ax.set_title(f"Channel {channel}")
-        ax.legend()
-        ax.grid(True)
+    def show_all(self):
+        if self.time is not None and len(self.time):
+            text = "" if self.event_index is None else f"{len(self.event_index)} blinks indexed"
+            self.set_view(self.time[0], self.time[-1], text)
 
     def goto_stage1(self):
         self.stacked_widget.setCurrentIndex(0)
@@ -367,18 +768,70 @@ class Stage2(QWidget):
     def export_image(self):
         file_name = self.user_name+"_"+self.user_date+"_"+"stage-2.png"
         file_name = file_name.replace("/","_")
-        self.figure.savefig(file_name)
+        self.figure.savefig(file_name, metadata=image_metadata(self.pipeline_config(), self.source_key))
         self.feedback_label.setText(f'Image saved to "{file_name}".')
 
+    # Statistics, event index and manifest written by export_stats
+    def export_names(self):
+        file_name = self.user_name+"_"+self.user_date+"_"+"blink-stats.csv"
+        file_name = file_name.replace("/","_")
+        return (file_name, file_name.replace("blink-stats.csv", "blink-events.npz"),
+                file_name.replace("blink-stats.csv", "manifest.json"))
+
+    def show_saved_index(self, data_key, config, future):
+        # Dropped if the data or settings have changed since it was requested
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        if data_key != self.data_key or config != self.pipeline_config():
+            return
+        # Detection finished first; its index is the same
+        if self.analyzed_thresholds == config.thresholds:
+            return
+        self.event_index = future.result()
+        self.nav_label.setText(f"{len(self.event_index)} blinks indexed (saved)")
+
+    def export_stats(self):
+        if self.stats is None:
+            return
+        if self.bridge.busy:
+            self.feedback_label.setText("Detection in progress, please wait.")
+            return
+        file_name, events_name, manifest = self.export_names()
+
+        # Skipped when the same file was already exported with the same settings
+        config = self.pipeline_config()
+        if self.source_key is not None and manifest_matches(manifest, self.source_key, config):
+            self.feedback_label.setText(f'"{file_name}" is already up to date.')
+            return
+        frame = self.stats.to_frame()
+        frame["input_hash"] = self.source_key
+        frame["config_hash"] = config.fingerprint()
+        frame.to_csv(file_name, index=False)
+        # The event index is kept next to the statistics for later sessions
+        self.event_index.save(events_name)
+        write_manifest(manifest, self.source_key, config, [file_name, events_name])
+        self.feedback_label.setText(f'Statistics saved to "{file_name}".')
+
 class MainApp(QStackedWidget):
     def __init__(self, eeg_data=None, time=None, fs=None, user_name=None, user_date=None):
         super().__init__()
-        self.stage1 = Stage1(eeg_data, time, fs, user_name, user_date, self)
-        self.stage2 = Stage2(self)
+        # The cache takes its share of the memory budget; recordings get the rest
+        budget = default_budget()
+        self.cache = ResultCache(max_bytes=cache_budget(budget))
+        self.workspace = Workspace(fs=fs or 256, cache=self.cache, budget=budget)  # Assumed sampling frequency
+        self.stage1 = Stage1(eeg_data, time, fs, user_name, user_date, self, self.cache, self.workspace)
+        self.engine = Engine()
+        self.stage2 = Stage2(self, self.cache, self.engine)
         self.addWidget(self.stage1)
         self.addWidget(self.stage2)
         self.setCurrentIndex(0)
 
+    def open_files(self, paths):
+        first = len(self.workspace.files)
+        self.stage1.set_files(paths)
+        self.stage1.show_file(first)
+        self.setCurrentIndex(0)
+
 def main():
     app = QApplication(sys.argv)
 
@@ -392,6 +845,8 @@ def main():
     # Add Main Application
     main_app = MainApp()
     stacked_widget.addWidget(main_app)
+    app.aboutToQuit.connect(main_app.workspace.shutdown)
+    app.aboutToQuit.connect(main_app.engine.shutdown)
 
     # Set window title and size
     stacked_widget.setWindowTitle("EEG Analysis Tool")
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import queue
+import threading
+import time as clock
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+from memory import load_averaged
+from stats import SessionStats, iter_blocks
+
+# Stages run at most this many calls at once unless an Engine is given other
+# limits. Loading is disk-bound and writing shares one output directory, so
+# they run one at a time; filtering and detection use a few threads (NumPy
+# and SciPy release the GIL in their inner loops)
+DEFAULT_LIMITS = {"load": 1, "filter": 2, "detect": 2, "stats": 2, "plot": 1, "write": 1}
+
+
+class Engine:
+    """Asyncio pipeline core that runs compute stages in an executor.
+
+    Coroutines call `await engine.run(stage, func, *args)`; the call runs
+    on the executor, never on the event loop, and each stage runs at most
+    limits[stage] calls at a time (1 for stages not listed). The same
+    coroutines work under asyncio.run() (batch, replay) or, through
+    submit(), on the engine's own loop thread, which keeps them off the Qt
+    event loop. submit() with a key cancels the earlier run with the same
+    key, so only the latest request for a view is finished; a call already
+    on the executor still completes, but its result is dropped.
+    """
+
+    def __init__(self, limits=None, workers=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.executor = ThreadPoolExecutor(max_workers=workers or sum(self.limits.values()),
+                                           thread_name_prefix="engine")
+        self.active = defaultdict(int)
+        self.peak = defaultdict(int)  # Most calls of each stage seen running at once
+        self._semaphores = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def _semaphore(self, stage):
+        # asyncio primitives belong to one loop, so there is a set per loop
+        loop = asyncio.get_running_loop()
+        key = (loop, stage)
+        if key not in self._semaphores:
+            self._semaphores = {k: s for k, s in self._semaphores.items() if not k[0].is_closed()}
+            self._semaphores[key] = asyncio.Semaphore(self.limits.get(stage, 1))
+        return self._semaphores[key]
+
+    async def run(self, stage, func, *args, **kwargs):
+        async with self._semaphore(stage):
+            with self._lock:
+                self.active[stage] += 1
+                self.peak[stage] = max(self.peak[stage], self.active[stage])
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+            finally:
+                with self._lock:
+                    self.active[stage] -= 1
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="engine-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro, key=None, callback=None, bridge=None):
+        """Run coro on the engine's loop thread; returns a concurrent Future.
+
+        callback(future) runs when it is done, cancelled or failed: on the
+        loop thread, or on whichever thread drains bridge if one is given.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        if key is not None:
+            with self._lock:
+                previous = self._latest.get(key)
+                self._latest[key] = future
+            if previous is not None:
+                previous.cancel()
+            future.add_done_callback(partial(self._forget, key))
+        if callback is not None:
+            if bridge is not None:
+                bridge.expect()
+                future.add_done_callback(partial(bridge.post, callback))
+            else:
+                future.add_done_callback(callback)
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._latest.get(key) is future:
+                del self._latest[key]
+
+    def cancel(self, key):
+        with self._lock:
+            future = self._latest.get(key)
+        return future is not None and future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+            futures = list(self._latest.values())
+        for future in futures:
+            future.cancel()
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.executor.shutdown(wait=True)
+
+
+class Bridge:
+    """Hands results from the engine's threads to one consuming thread.
+
+    post() may be called from any thread; drain() runs the posted calls on
+    the thread that calls it, e.g. from a Qt timer on the GUI thread.
+    """
+
+    def __init__(self):
+        self._calls = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._expected = 0
+
+    def expect(self):
+        with self._lock:
+            self._expected += 1
+
+    def post(self, func, *args):
+        self._calls.put((func, args))
+
+    def drain(self):
+        """Run the calls posted so far; returns how many ran."""
+        count = 0
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                return count
+            with self._lock:
+                self._expected = max(self._expected - 1, 0)
+            func(*args)
+            count += 1
+
+    @property
+    def busy(self):
+        """True while results are still expected from submitted work."""
+        with self._lock:
+            return self._expected > 0
+
+
+# Pipelines shared by the GUI, batch runs and replay
+
+async def analyze(engine, time, filtered, thresholds, refractory=0, block_size=1 << 16):
+    """Session statistics, per-channel events and joint events of filtered data.
+
+    One streaming pass yields the statistics and the events; the joint
+    events are merged from those, without another pass over the samples.
+    """
+    stats = await engine.run("stats", lambda: SessionStats(thresholds, refractory).feed_blocks(
+        iter_blocks(time, filtered, block_size)))
+    return stats, stats.events(), stats.coincidences()
+
+
+async def process(engine, path, config):
+    """Load, filter and analyze one recording under config."""
+    time, raw = await engine.run("load", load_averaged, path, config.average, config.channels, config.precision)
+    filtered = await engine.run("filter", config.apply, raw)
+    stats, events, joint = await analyze(engine, time, filtered, config.thresholds, config.refractory_samples())
+    return time, filtered, stats, events, joint
+
+
+async def stream(engine, source, config, depth=4):
+    """Session statistics of a streamed recording, e.g. a ReplaySource.
+
+    Blocks are filtered causally, with state carried across blocks, then
+    fed to the detectors; filtering the next block overlaps detecting the
+    current one. The chain's sections run twice, which matches the
+    magnitude response of the zero-phase offline filter, so counts agree
+    closely with a batch run; events are delayed by the filter's phase lag.
+    """
+    sos = np.vstack([config.chain().sos] * 2)
+    session = SessionStats(config.thresholds, config.refractory_samples())
+    filtered = asyncio.Queue(maxsize=depth)
+    state = {}
+
+    def low_pass(data):
+        if "zi" not in state:
+            state["zi"] = sosfilt_zi(sos)[:, None, :] * np.asarray(data[:, :1], dtype=np.float64)[None]
+        out, state["zi"] = sosfilt(sos, data, axis=-1, zi=state["zi"])
+        return out
+
+    async def produce():
+        try:
+            async for block in source:
+                await filtered.put((block.time, await engine.run("filter", low_pass, block.data)))
+        finally:
+            await filtered.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await filtered.get()
+            if item is None:
+                break
+            await engine.run("detect", session.feed, *item)
+        await producer
+    finally:
+        producer.cancel()
+    session.finish()
+    return session
+
+
+# Self-check: stage limits, latest-wins submits and loop responsiveness
+
+def _check_limits(engine, calls=12, seconds=0.05):
+    async def burst():
+        await asyncio.gather(*(engine.run(stage, clock.sleep, seconds)
+                               for stage in ("load", "filter") for _ in range(calls)))
+
+    asyncio.run(burst())
+    for stage in ("load", "filter"):
+        assert engine.peak[stage] <= engine.limits[stage], f"{stage} ran {engine.peak[stage]} at once"
+    return dict(engine.peak)
+
+
+def _check_latest(engine, requests=20):
+    bridge = Bridge()
+    finished = []
+
+    async def slow(value):
+        await engine.run("filter", clock.sleep, 0.05)
+        return value
+
+    for value in range(requests):
+        engine.submit(slow(value), key="view", callback=finished.append, bridge=bridge)
+    while bridge.busy:
+        bridge.drain()
+        clock.sleep(0.01)
+    done = [future.result() for future in finished if not future.cancelled()]
+    assert done and done[-1] == requests - 1, done
+    return len(done)
+
+
+def _loop_lag(engine, path, config, repeats):
+    # Longest gap between ticks of a 10 ms timer on the calling thread while
+    # recordings are processed on the engine
+    futures = [engine.submit(process(engine, path, config)) for _ in range(repeats)]
+    worst = 0.0
+    last = clock.perf_counter()
+    while not all(future.done() for future in futures):
+        clock.sleep(0.01)
+        now = clock.perf_counter()
+        worst = max(worst, now - last - 0.01)
+        last = now
+    for future in futures:
+        future.result()
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the pipeline engine and time it on a recording.")
+    parser.add_argument("path", nargs="?", default="eeg-data/Ecog_waveform.csv")
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--filter-limit", type=int, default=DEFAULT_LIMITS["filter"])
+    args = parser.parse_args()
+
+    from pipeline import PipelineConfig
+
+    engine = Engine({"filter": args.filter_limit})
+    try:
+        print("Peak concurrency:", _check_limits(engine))
+        print(f"Latest-wins: {_check_latest(engine)} of 20 superseding requests finished")
+        config = PipelineConfig()
+        start = clock.perf_counter()
+        lag = _loop_lag(engine, args.path, config, args.repeats)
+        print(f"{args.repeats} x {args.path} in {clock.perf_counter() - start:.2f} s; "
+              f"caller stalled at most {1000 * lag:.1f} ms")
+    finally:
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
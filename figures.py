@@ -0,0 +1,139 @@
+import argparse
+import io
+import os
+import time as clock
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from detection import detect_blinks, threshold_range
+from filters import standard_chain
+from recording import CHANNELS, load_recording
+from traces import channel_times
+
+
+# Figures are built without pyplot so they need no display and no GUI
+# backend; Qt widgets wrap them in FigureCanvasQTAgg, everything else
+# renders them with Agg
+def new_figure(figsize=(8, 8), rows=2):
+    figure = Figure(figsize=figsize)
+    axes = figure.subplots(rows, 1)
+    figure.tight_layout(pad=3)
+    return figure, axes
+
+
+# Raw and filtered traces per channel; returns the filtered lines so
+# callers can update them in place. Without filtered only raw is drawn.
+# time is shared by every channel, or one row per channel when decimated
+def draw_stage1(axes, time, raw, filtered=None, channels=CHANNELS):
+    times = channel_times(time, len(raw))
+    lines = []
+    for row, (ax, channel) in enumerate(zip(axes, channels)):
+        ax.clear()
+        ax.plot(times[row], raw[row], label=f"Raw {channel}", alpha=0.5)
+        if filtered is not None:
+            line, = ax.plot(times[row], filtered[row], label=f"Filtered {channel}", alpha=0.8)
+            lines.append(line)
+        ax.set_title(f"Channel {channel}")
+        ax.set_ylabel("Amplitude (μV)")
+        ax.legend()
+        ax.grid(True)
+    axes[-1].set_xlabel("Time (s)")
+    return lines
+
+
+# Filtered trace, detected blink samples and the threshold band for one channel
+def draw_stage2_channel(ax, time, data, blink_idx, lower, upper, channel):
+    ax.clear()
+    ax.plot(time, data, label=f"{channel} Filtered", alpha=0.8)
+    ax.scatter(time[blink_idx], data[blink_idx], color="red", label="Detected Blinks", zorder=5)
+    ax.axhline(upper, color="green", linestyle="--", label=f"Upper Threshold ({upper} μV)")
+    ax.axhline(lower, color="green", linestyle="--", label=f"Lower Threshold ({lower} μV)")
+    ax.set_title(f"Channel {channel}")
+    ax.legend()
+    ax.grid(True)
+
+
+def stage1_figure(time, raw, filtered, figsize=(8, 8)):
+    figure, axes = new_figure(figsize)
+    draw_stage1(axes, time, raw, filtered)
+    return figure
+
+
+# thresholds maps channel -> (lower, upper); blinks are detected if not given
+def stage2_figure(time, filtered, thresholds, blink_indices=None, figsize=(8, 8)):
+    figure, axes = new_figure(figsize)
+    for row, (ax, channel) in enumerate(zip(axes, CHANNELS)):
+        lower, upper = thresholds[channel]
+        if blink_indices is None:
+            blink_idx = detect_blinks(filtered[row], lower, upper)
+        else:
+            blink_idx = blink_indices[row]
+        draw_stage2_channel(ax, time, filtered[row], blink_idx, lower, upper, channel)
+    return figure
+
+
+# Small unlabeled overview of every channel, for file lists
+def thumbnail_figure(time, data, figsize=(2.4, 1.2)):
+    figure = Figure(figsize=figsize)
+    axes = figure.subplots(len(data), 1, sharex=True)
+    for ax, times, row in zip(axes, channel_times(time, len(data)), data):
+        ax.plot(times, row, linewidth=0.5)
+        ax.set_axis_off()
+    figure.subplots_adjust(left=0, right=1, bottom=0, top=1, hspace=0.05)
+    return figure
+
+
+def render_png(figure, dpi=100):
+    buffer = io.BytesIO()
+    FigureCanvasAgg(figure)
+    figure.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
+
+
+def _render_job(job):
+    kind, kwargs, dpi = job
+    builder = stage1_figure if kind == "stage1" else stage2_figure
+    return render_png(builder(**kwargs), dpi=dpi)
+
+
+def render_many(jobs, workers=None):
+    """Render ("stage1" | "stage2", kwargs, dpi) jobs to PNG bytes in worker processes."""
+    jobs = list(jobs)
+    if workers == 1 or len(jobs) < 2:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_job, jobs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Stage 1 and Stage 2 figures without a display.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--out-dir", default="figures")
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--cutoff", type=float, default=30)
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    thresholds = {channel: threshold_range(channel) for channel in CHANNELS}
+    jobs, names = [], []
+    for path in args.paths:
+        time, raw = load_recording(path)
+        filtered = standard_chain(args.fs, args.cutoff).apply(raw)
+        name = os.path.splitext(os.path.basename(path))[0]
+        jobs.append(("stage1", {"time": time, "raw": raw, "filtered": filtered}, args.dpi))
+        jobs.append(("stage2", {"time": time, "filtered": filtered, "thresholds": thresholds}, args.dpi))
+        names += [f"{name}_stage-1.png", f"{name}_stage-2.png"]
+
+    start = clock.perf_counter()
+    images = render_many(jobs, args.workers)
+    elapsed = clock.perf_counter() - start
+    for name, image in zip(names, images):
+        with open(os.path.join(args.out_dir, name), "wb") as f:
+            f.write(image)
+    print(f"Rendered {len(images)} figures in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
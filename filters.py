@@ -0,0 +1,251 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, filtfilt, iirnotch, sosfiltfilt, tf2sos
+
+
+# Butterworth low-pass filter
+def low_pass_filter(data, cutoff, fs, order=4, out=None):
+    nyquist = 0.5 * fs
+    normal_cutoff = cutoff / nyquist
+    b, a = butter(order, normal_cutoff, btype='low', analog=False)
+    filtered_data = filtfilt(b, a, data, axis=-1)
+    if out is None:
+        return filtered_data
+    np.copyto(out, filtered_data)
+    return out
+
+
+# Butterworth high-pass filter (DC removal)
+def high_pass_filter(data, cutoff, fs, order=4, out=None):
+    nyquist = 0.5 * fs
+    normal_cutoff = cutoff / nyquist
+    b, a = butter(order, normal_cutoff, btype='high', analog=False)
+    filtered_data = filtfilt(b, a, data, axis=-1)
+    if out is None:
+        return filtered_data
+    np.copyto(out, filtered_data)
+    return out
+
+
+class FilterExecutor:
+    """Runs per-channel filters on a thread pool.
+
+    SciPy releases the GIL inside its filtering loops, so channels filter
+    concurrently. Every channel is filtered on its own, one row at a time,
+    in both the threaded and the serial path, so the two give identical
+    results. Inputs shorter than min_samples in total are filtered serially.
+    """
+
+    def __init__(self, max_workers=None, min_samples=1 << 16):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_samples = min_samples
+        self._pool = None
+
+    def _use_pool(self, channels):
+        if self.max_workers < 2 or len(channels) < 2:
+            return False
+        return sum(len(channel) for channel in channels) >= self.min_samples
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="filter")
+        return self._pool
+
+    def run_chain(self, stages, channels):
+        """Apply stages, a list of (func, args, kwargs), in order to every channel."""
+        def run(channel):
+            for func, args, kwargs in stages:
+                channel = func(channel, *args, **kwargs)
+            return channel
+
+        channels = list(channels)
+        if not self._use_pool(channels):
+            return [run(channel) for channel in channels]
+        return list(self._get_pool().map(run, channels))
+
+    def map(self, func, channels, *args, **kwargs):
+        """Apply func(channel, *args, **kwargs) to every channel."""
+        return self.run_chain([(func, args, kwargs)], channels)
+
+    def apply(self, func, data, *args, out=None, **kwargs):
+        """Filter each row of a 2D array, writing the rows into out if given."""
+        results = self.map(func, data, *args, **kwargs)
+        if out is None:
+            out = np.empty((len(results),) + np.shape(results[0]), dtype=results[0].dtype)
+        for row, result in zip(out, results):
+            np.copyto(row, result)
+        return out
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+# Second-order sections for a single stage, e.g. ('lowpass', 30, 4)
+@lru_cache(maxsize=128)
+def design_stage(stage, fs):
+    kind = stage[0]
+    if kind == 'lowpass':
+        _, cutoff, order = stage
+        sos = butter(order, cutoff, btype='low', fs=fs, output='sos')
+    elif kind == 'highpass':
+        _, cutoff, order = stage
+        sos = butter(order, cutoff, btype='high', fs=fs, output='sos')
+    elif kind == 'notch':
+        _, freq, quality = stage
+        b, a = iirnotch(freq, quality, fs=fs)
+        sos = tf2sos(b, a)
+    else:
+        raise ValueError(f"Unknown filter stage: {kind!r}")
+    return sos
+
+
+# All stages of a chain stacked into one cascade
+@lru_cache(maxsize=128)
+def design_chain(stages, fs):
+    sos = np.vstack([design_stage(stage, fs) for stage in stages])
+    return sos
+
+
+# Zero-phase SOS filtering. Filter state and arithmetic are float64; the
+# output keeps the input's float dtype, and float32 input is filtered one
+# row at a time so the float64 temporaries stay one channel long
+def apply_sos(data, sos, out=None):
+    data = np.asarray(data)
+    dtype = data.dtype if data.dtype in (np.float32, np.float64) else np.float64
+    if out is None:
+        if dtype == np.float64 or data.ndim == 1:
+            return sosfiltfilt(sos, data, axis=-1).astype(dtype, copy=False)
+        out = np.empty(data.shape, dtype=dtype)
+    if data.ndim == 1 or out.dtype == np.float64:
+        np.copyto(out, sosfiltfilt(sos, data, axis=-1), casting="same_kind")
+        return out
+    for row, out_row in zip(data, out):
+        np.copyto(out_row, sosfiltfilt(sos, row), casting="same_kind")
+    return out
+
+
+class FilterChain:
+    """Declarative filter chain applied as one zero-phase SOS cascade.
+
+    Chains are immutable; each builder method returns a new chain:
+
+        chain = FilterChain(250).highpass(0.1, 5).notch(50).lowpass(30, 5)
+        filtered = chain.apply(data)
+    """
+
+    def __init__(self, fs, stages=()):
+        self.fs = fs
+        self.stages = tuple(stages)
+
+    def _add(self, stage):
+        return FilterChain(self.fs, self.stages + (stage,))
+
+    def lowpass(self, cutoff, order=4):
+        return self._add(('lowpass', cutoff, order))
+
+    def highpass(self, cutoff, order=4):
+        return self._add(('highpass', cutoff, order))
+
+    def notch(self, freq, quality=30):
+        return self._add(('notch', freq, quality))
+
+    @property
+    def sos(self):
+        return design_chain(self.stages, self.fs)
+
+    def apply(self, data, out=None):
+        if not self.stages:
+            if out is None:
+                return np.array(data, dtype=np.result_type(data, np.float32))
+            np.copyto(out, data)
+            return out
+        return apply_sos(data, self.sos, out=out)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterChain) and (self.fs, self.stages) == (other.fs, other.stages)
+
+    def __hash__(self):
+        return hash((self.fs, self.stages))
+
+    def __repr__(self):
+        return f"FilterChain(fs={self.fs}, stages={self.stages})"
+
+
+class ChainRunner:
+    """Reapplies changing chains to fixed data.
+
+    Every chain is applied as its one fused cascade, so a result depends
+    only on the data and the chain, never on which chains ran before. The
+    designs are cached by design_chain; the last max_results outputs are
+    kept so returning to a recent setting costs nothing.
+    """
+
+    def __init__(self, data, fs, executor=None, max_results=2):
+        self.data = np.asarray(data)
+        if self.data.dtype not in (np.float32, np.float64):
+            self.data = self.data.astype(np.float64)
+        self.fs = fs
+        self.executor = executor
+        self.max_results = max_results
+        self._results = OrderedDict()
+
+    def _filter(self, stages):
+        sos = design_chain(stages, self.fs)
+        if self.executor is None or self.data.ndim == 1:
+            return apply_sos(self.data, sos)
+        return self.executor.apply(apply_sos, self.data, sos)
+
+    def run(self, chain, out=None):
+        stages = chain.stages
+        if not stages:
+            result = self.data
+        elif stages in self._results:
+            result = self._results[stages]
+            self._results.move_to_end(stages)
+        else:
+            result = self._filter(stages)
+            if self.max_results > 0:
+                self._results[stages] = result
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+
+        if out is None:
+            return result
+        np.copyto(out, result)
+        return out
+
+
+# Highest whole-Hz low-pass cutoff below the Nyquist frequency, for
+# recordings averaged down to a low sample rate
+def max_cutoff(fs, limit=100):
+    return max(1, min(limit, int(np.ceil(fs / 2)) - 1))
+
+
+# Optional DC removal, optional mains notch, then the low-pass
+def standard_chain(fs, cutoff, dc_removal=False, notch=None, order=4):
+    chain = FilterChain(fs)
+    if dc_removal:
+        chain = chain.highpass(0.1, order)
+    if notch:
+        chain = chain.notch(notch)
+    return chain.lowpass(cutoff, order)
+
+
+# Largest difference between the float32 and float64 paths, in μV
+def precision_deviation(raw, chain):
+    reference = chain.apply(np.asarray(raw, dtype=np.float64))
+    single = chain.apply(np.asarray(raw, dtype=np.float32))
+    if single.dtype != np.float32:
+        raise TypeError(f"{chain.stages} turned float32 input into {single.dtype}")
+    return float(np.abs(single.astype(np.float64) - reference).max())
+
+
+# float32 keeps about 7 significant digits, i.e. ~1e-3 μV at ±8e3 μV; the
+# bundled recordings deviate by at most ~5e-4 μV
+FLOAT32_TOLERANCE = 0.01
@@ -0,0 +1,204 @@
+import argparse
+import os
+import time as clock
+from functools import lru_cache
+import numpy as np
+from scipy.signal import firwin, kaiserord, lfilter
+
+
+# Kernels up to this many taps are convolved directly; longer ones use
+# overlap-save. The crossover depends on the machine and is not measured at
+# run time: this is a fixed default near the crossovers seen so far (33-65
+# taps). 'python fir.py' measures it and prints the setting for
+# EEGAME_FIR_DIRECT_MAX_TAPS, which overrides the default
+DIRECT_MAX_TAPS = int(os.environ.get("EEGAME_FIR_DIRECT_MAX_TAPS", 48))
+
+
+# Linear-phase Kaiser-window FIR with an odd number of taps
+@lru_cache(maxsize=64)
+def design_fir(fs, cutoff, transition=None, attenuation=60, btype="lowpass"):
+    transition = transition or max(0.1 * cutoff, 0.5)
+    numtaps, beta = kaiserord(attenuation, transition / (0.5 * fs))
+    numtaps |= 1
+    taps = firwin(numtaps, cutoff, window=("kaiser", beta), pass_zero=btype, fs=fs)
+    return taps
+
+
+def choose_method(numtaps, direct_max_taps=DIRECT_MAX_TAPS):
+    return "direct" if numtaps <= direct_max_taps else "fft"
+
+
+def _next_pow2(n):
+    return 1 << int(np.ceil(np.log2(max(n, 1))))
+
+
+class OverlapSave:
+    """Block FFT convolution of a signal with a fixed FIR kernel.
+
+    The kernel spectrum is computed once and the frame buffer is reused
+    across calls. process() is causal and streaming: it returns one output
+    sample per input sample and carries the last numtaps - 1 inputs over to
+    the next call. Works along the last axis of 1D or 2D input.
+    """
+
+    def __init__(self, taps, nfft=None, batch_frames=32):
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.numtaps = len(self.taps)
+        self.nfft = nfft or max(_next_pow2(4 * self.numtaps), 256)
+        if self.nfft < self.numtaps:
+            raise ValueError("nfft must be at least the number of taps")
+        self.step = self.nfft - self.numtaps + 1
+        self.batch_frames = batch_frames
+        self.spectrum = np.fft.rfft(self.taps, self.nfft)
+        self._frames = np.empty((batch_frames, self.nfft))
+        self._history = None
+
+    def reset(self):
+        self._history = None
+
+    def _convolve_row(self, ext, n, out):
+        # ext holds numtaps - 1 history samples followed by n new ones
+        overlap = self.numtaps - 1
+        frames = -(-n // self.step)
+        padded = np.zeros(overlap + frames * self.step + (self.nfft - self.step - overlap))
+        padded[:len(ext)] = ext
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.nfft)[::self.step]
+        for first in range(0, frames, self.batch_frames):
+            count = min(self.batch_frames, frames - first)
+            batch = self._frames[:count]
+            np.copyto(batch, windows[first:first + count])
+            result = np.fft.irfft(np.fft.rfft(batch, axis=-1) * self.spectrum, self.nfft, axis=-1)
+            valid = result[:, overlap:].ravel()
+            lo = first * self.step
+            hi = min(n, lo + count * self.step)
+            out[lo:hi] = valid[:hi - lo]
+
+    def process(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        squeeze = x.ndim == 1
+        x2 = np.atleast_2d(x)
+        overlap = self.numtaps - 1
+        if self._history is None or self._history.shape[0] != x2.shape[0]:
+            self._history = np.zeros((x2.shape[0], overlap))
+        out = np.empty_like(x2)
+        n = x2.shape[1]
+        for row in range(x2.shape[0]):
+            ext = np.concatenate([self._history[row], x2[row]])
+            self._convolve_row(ext, n, out[row])
+            if overlap:
+                self._history[row] = ext[-overlap:]
+        return out[0] if squeeze else out
+
+
+class DirectFIR:
+    """Streaming direct-form FIR with the same interface as OverlapSave."""
+
+    def __init__(self, taps):
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.numtaps = len(self.taps)
+        self._zi = None
+
+    def reset(self):
+        self._zi = None
+
+    def process(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        x2 = np.atleast_2d(x)
+        if self._zi is None or self._zi.shape[0] != x2.shape[0]:
+            self._zi = np.zeros((x2.shape[0], self.numtaps - 1))
+        out, self._zi = lfilter(self.taps, [1.0], x2, axis=-1, zi=self._zi)
+        return out[0] if x.ndim == 1 else out
+
+
+def make_engine(taps, method="auto", **options):
+    if method == "auto":
+        method = choose_method(len(taps))
+    if method == "direct":
+        return DirectFIR(taps)
+    return OverlapSave(taps, **options)
+
+
+class FIRFilter:
+    """Zero-phase linear-phase FIR filter for whole recordings.
+
+    The kernel's (numtaps - 1) / 2 sample delay is removed. The ends are
+    padded by odd reflection, as filtfilt does, to limit edge transients.
+    Has the same apply() interface as FilterChain.
+    """
+
+    def __init__(self, fs, cutoff, transition=None, attenuation=60, btype="lowpass", method="auto"):
+        self.fs = fs
+        self.taps = design_fir(fs, cutoff, transition, attenuation, btype)
+        self.method = choose_method(len(self.taps)) if method == "auto" else method
+        self.stages = (("fir", btype, cutoff, transition, attenuation),)
+
+    @property
+    def delay(self):
+        return (len(self.taps) - 1) // 2
+
+    def apply(self, data, out=None):
+        data = np.asarray(data)
+        x = np.atleast_2d(data).astype(np.float64, copy=False)
+        d = self.delay
+        n = x.shape[-1]
+        pad = min(d, n - 1)
+        left = 2 * x[:, :1] - x[:, pad:0:-1]
+        right = 2 * x[:, -1:] - x[:, -2:-pad - 2:-1]
+        tail = np.zeros((x.shape[0], 2 * d))
+        extended = np.hstack([left, x, right, tail])
+        y = make_engine(self.taps, self.method).process(extended)
+        # Output for input sample t appears at padded index t + pad + d
+        result = y[:, pad + d:pad + d + n]
+        dtype = data.dtype if data.dtype in (np.float32, np.float64) else np.float64
+        result = result.astype(dtype, copy=False)
+        if data.ndim == 1:
+            result = result[0]
+        if out is None:
+            return result
+        np.copyto(out, result)
+        return out
+
+
+def benchmark(seconds=3600, fs=256, taps_list=(8, 16, 32, 64, 128, 256, 512, 1024, 2048), repeats=3):
+    """Time direct and overlap-save filtering of one channel; return the crossover.
+
+    The crossover is the shortest kernel from which overlap-save stays
+    faster for every longer kernel, so one noisy timing does not decide it.
+    """
+    x = np.random.default_rng(0).normal(size=int(seconds * fs))
+    faster = []
+    for numtaps in taps_list:
+        taps = firwin(numtaps | 1, 0.2)
+        timings = {}
+        for method in ("direct", "fft"):
+            start = clock.perf_counter()
+            for _ in range(repeats):
+                make_engine(taps, method).process(x)
+            timings[method] = (clock.perf_counter() - start) / repeats
+        faster.append((numtaps | 1, timings["fft"] < timings["direct"]))
+        print(f"{numtaps | 1:5d} taps: direct {1000 * timings['direct']:8.1f} ms  "
+              f"overlap-save {1000 * timings['fft']:8.1f} ms")
+    crossover, direct_max = None, None
+    for numtaps, fft_faster in reversed(faster):
+        if not fft_faster:
+            break
+        crossover = numtaps
+    if crossover is not None:
+        direct_max = max((numtaps for numtaps, _ in faster if numtaps < crossover), default=0)
+        print(f"Overlap-save is faster from {crossover} taps; "
+              f"set EEGAME_FIR_DIRECT_MAX_TAPS={direct_max} (now {DIRECT_MAX_TAPS})")
+    else:
+        print("Direct convolution was faster for every kernel length tried")
+    return crossover
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark direct vs overlap-save FIR filtering.")
+    parser.add_argument("--seconds", type=float, default=3600)
+    parser.add_argument("--fs", type=float, default=256)
+    args = parser.parse_args()
+    benchmark(args.seconds, args.fs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import time as clock
+import numpy as np
+
+# Detection kernels behind detection.py: the threshold mask, runs of samples
+# outside the band, the merging of runs within a refractory period and the
+# runs' peaks. Numba is optional. Without it the loop kernels still run as
+# plain Python, which is only fast enough to cross-check the NumPy kernels
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# Loop kernels, shared by the "numba" and "python" backends
+
+def _threshold_runs_loop(data, lower, upper):
+    n = len(data)
+    starts = np.empty(n // 2 + 1, dtype=np.int64)
+    ends = np.empty(n // 2 + 1, dtype=np.int64)
+    k = 0
+    inside = False
+    for i in range(n):
+        outside = data[i] < lower or data[i] > upper
+        if outside and not inside:
+            starts[k] = i
+            inside = True
+        elif inside and not outside:
+            ends[k] = i
+            k += 1
+            inside = False
+    if inside:
+        ends[k] = n
+        k += 1
+    return starts[:k], ends[:k]
+
+
+def _merge_runs_loop(starts, ends, refractory):
+    merged_starts = np.empty(len(starts), dtype=np.int64)
+    merged_ends = np.empty(len(starts), dtype=np.int64)
+    k = 0
+    for i in range(len(starts)):
+        if k > 0 and starts[i] - merged_ends[k - 1] < refractory:
+            merged_ends[k - 1] = ends[i]
+        else:
+            merged_starts[k] = starts[i]
+            merged_ends[k] = ends[i]
+            k += 1
+    return merged_starts[:k], merged_ends[:k]
+
+
+def _run_peaks_loop(data, starts, ends, center):
+    peaks = np.empty(len(starts), dtype=np.int64)
+    for k in range(len(starts)):
+        best = starts[k]
+        best_value = abs(data[best] - center)
+        for i in range(starts[k] + 1, ends[k]):
+            value = abs(data[i] - center)
+            if value > best_value:
+                best = i
+                best_value = value
+        peaks[k] = best
+    return peaks
+
+
+# van Herk/Gil-Werman running maximum: two passes over blocks of the window
+# width, so the cost does not depend on the window
+def _envelope_loop(data, window, center):
+    n = len(data)
+    half = window // 2
+    width = 2 * half + 1
+    m = n + 2 * half
+    blocks = -(-m // width)
+    padded = np.full(blocks * width, -np.inf)
+    for i in range(n):
+        padded[half + i] = abs(data[i] - center)
+    prefix = np.empty_like(padded)
+    suffix = np.empty_like(padded)
+    for b in range(blocks):
+        lo = b * width
+        prefix[lo] = padded[lo]
+        for i in range(lo + 1, lo + width):
+            prefix[i] = max(prefix[i - 1], padded[i])
+        hi = lo + width - 1
+        suffix[hi] = padded[hi]
+        for i in range(hi - 1, lo - 1, -1):
+            suffix[i] = max(suffix[i + 1], padded[i])
+    out = np.empty(n)
+    for i in range(n):
+        out[i] = max(suffix[i], prefix[i + width - 1])
+    return out
+
+
+# Vectorized NumPy kernels
+
+# Samples outside [lower, upper], written into out if given
+def threshold_mask(data, lower, upper, out=None, scratch=None):
+    if out is None:
+        out = np.empty(np.shape(data), dtype=bool)
+    if scratch is None:
+        scratch = np.empty(np.shape(data), dtype=bool)
+    np.greater(data, upper, out=out)
+    np.less(data, lower, out=scratch)
+    np.logical_or(out, scratch, out=out)
+    return out
+
+
+def _threshold_runs_numpy(data, lower, upper):
+    mask = threshold_mask(data, lower, upper).view(np.int8)
+    edges = np.diff(mask, prepend=np.int8(0), append=np.int8(0))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _merge_runs_numpy(starts, ends, refractory):
+    if not len(starts):
+        return starts, ends
+    first = np.empty(len(starts), dtype=bool)
+    first[0] = True
+    np.greater_equal(starts[1:] - ends[:-1], refractory, out=first[1:])
+    last = np.empty_like(first)
+    last[:-1] = first[1:]
+    last[-1] = True
+    return starts[first], ends[last]
+
+
+def _run_peaks_numpy(data, starts, ends, center):
+    if not len(starts):
+        return np.empty(0, dtype=np.int64)
+    # Only the samples inside runs are visited, so sparse runs in a long
+    # block cost little
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    rows = np.arange(offsets[-1] + lengths[-1]) + np.repeat(starts - offsets, lengths)
+    deviation = np.abs(np.asarray(data[rows], dtype=np.float64) - center)
+    peak_values = np.maximum.reduceat(deviation, offsets)
+
+    # First sample of each run reaching its peak
+    hits = np.flatnonzero(deviation == np.repeat(peak_values, lengths))
+    run_id = np.repeat(np.arange(len(starts)), lengths)[hits]
+    first = np.ones(len(hits), dtype=bool)
+    np.not_equal(run_id[1:], run_id[:-1], out=first[1:])
+    return rows[hits[first]]
+
+
+def _envelope_numpy(data, window, center):
+    n = len(data)
+    half = window // 2
+    width = 2 * half + 1
+    blocks = -(-(n + 2 * half) // width)
+    padded = np.full(blocks * width, -np.inf)
+    np.abs(np.asarray(data, dtype=np.float64) - center, out=padded[half:half + n])
+    grid = padded.reshape(blocks, width)
+    prefix = np.maximum.accumulate(grid, axis=1).ravel()
+    suffix = np.maximum.accumulate(grid[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(suffix[:n], prefix[width - 1:width - 1 + n])
+
+
+_LOOP_KERNELS = {
+    "threshold_runs": _threshold_runs_loop,
+    "merge_runs": _merge_runs_loop,
+    "run_peaks": _run_peaks_loop,
+    "envelope": _envelope_loop,
+}
+
+BACKENDS = {
+    "numpy": {
+        "threshold_runs": _threshold_runs_numpy,
+        "merge_runs": _merge_runs_numpy,
+        "run_peaks": _run_peaks_numpy,
+        "envelope": _envelope_numpy,
+    },
+    "python": _LOOP_KERNELS,
+}
+if njit is not None:
+    BACKENDS["numba"] = {name: njit(cache=True, nogil=True)(func) for name, func in _LOOP_KERNELS.items()}
+
+DEFAULT_BACKEND = "numba" if "numba" in BACKENDS else "numpy"
+
+
+def _kernel(name, backend):
+    return BACKENDS[backend or DEFAULT_BACKEND][name]
+
+
+# Runs of samples outside [lower, upper] as (starts, ends), ends exclusive
+def threshold_runs(data, lower, upper, backend=None):
+    return _kernel("threshold_runs", backend)(np.asarray(data), lower, upper)
+
+
+# Runs separated by fewer than refractory samples become one run
+def merge_runs(starts, ends, refractory, backend=None):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    return _kernel("merge_runs", backend)(starts, ends, refractory)
+
+
+# Index of the largest deviation from center within each run
+def run_peaks(data, starts, ends, center=0.0, backend=None):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    return _kernel("run_peaks", backend)(np.asarray(data), starts, ends, center)
+
+
+# Running maximum of |data - center| over a centred window of samples
+def envelope(data, window, center=0.0, backend=None):
+    return _kernel("envelope", backend)(np.asarray(data), window, center)
+
+
+def detect(data, lower, upper, refractory=0, backend=None):
+    """(starts, ends, peaks) of blink runs, merging runs closer than refractory samples."""
+    starts, ends = threshold_runs(data, lower, upper, backend)
+    if refractory > 0:
+        starts, ends = merge_runs(starts, ends, refractory, backend)
+    return starts, ends, run_peaks(data, starts, ends, 0.5 * (lower + upper), backend)
+
+
+def cross_check(samples=20000, seed=0):
+    """Run every backend on the same random data and assert identical results."""
+    rng = np.random.default_rng(seed)
+    data = np.cumsum(rng.normal(0, 30, samples)) + rng.normal(0, 60, samples)
+    lower, upper = np.percentile(data, [10, 90])
+    reference = None
+    for name in BACKENDS:
+        result = detect(data, lower, upper, refractory=25, backend=name) + (envelope(data, 33, 0.0, name),)
+        if reference is None:
+            reference = result
+        for expected, actual in zip(reference, result):
+            assert np.array_equal(expected, actual), f"{name} backend disagrees"
+    return list(BACKENDS)
+
+
+def benchmark(channels=64, minutes=60, fs=256, backend=None):
+    """Seconds to detect (with refractory merging) and envelope synthetic channels."""
+    rng = np.random.default_rng(0)
+    n = int(minutes * 60 * fs)
+    refractory = int(0.2 * fs)
+    window = int(0.5 * fs)
+    timings = {"detect": 0.0, "envelope": 0.0}
+    events = 0
+    for _ in range(channels):
+        data = rng.normal(0, 60, n).astype(np.float32)
+        data[rng.integers(0, n, n // 2000)] += 600
+        start = clock.perf_counter()
+        starts, _, _ = detect(data, -250, 250, refractory, backend)
+        timings["detect"] += clock.perf_counter() - start
+        start = clock.perf_counter()
+        envelope(data, window, 0.0, backend)
+        timings["envelope"] += clock.perf_counter() - start
+        events += len(starts)
+    return timings, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-check and benchmark the detection kernels.")
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--fs", type=float, default=256)
+    args = parser.parse_args()
+
+    print("Backends agree:", ", ".join(cross_check()))
+    for name in BACKENDS:
+        if name == "python":
+            continue
+        timings, events = benchmark(args.channels, args.minutes, args.fs, name)
+        print(f"{name}: {args.channels} channels x {args.minutes:g} min, {events} events; "
+              f"detect {timings['detect']:.2f} s, envelope {timings['envelope']:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
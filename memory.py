@@ -0,0 +1,287 @@
+import argparse
+import os
+import re
+import time as clock
+from collections import namedtuple
+from contextlib import contextmanager
+import numpy as np
+from cache import CACHE_VERSION, DEFAULT_CACHE_DIR, file_hash
+from recording import CHANNELS, count_rows, iter_recording, load_recording, sample_dtype
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+STRATEGIES = ("memory", "mmap", "chunked")
+MMAP_DIR = os.path.join(DEFAULT_CACHE_DIR, "mmap")
+
+
+def parse_size(text):
+    """Bytes in a size like '512M', '2G' or '1048576'."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(text), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"not a size: {text!r}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
+
+
+def available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# EEGAME_MEMORY_BUDGET if set, otherwise half of the memory available now
+def default_budget():
+    if os.environ.get("EEGAME_MEMORY_BUDGET"):
+        return parse_size(os.environ["EEGAME_MEMORY_BUDGET"])
+    available = available_memory()
+    return available // 2 if available else 1 << 30
+
+
+# Share of the memory budget held by the result cache, which keeps filtered
+# copies and other results of every file; recordings are planned against the rest
+CACHE_SHARE = 0.25
+
+
+def cache_budget(budget):
+    return int(budget * CACHE_SHARE)
+
+
+# Bytes held per sample row (all channels) by each part of a session. Cached
+# results count against the cache's share of the budget, not here; results
+# are the full-size outputs a ChainRunner keeps (its max_results)
+def row_costs(channels=len(CHANNELS), itemsize=8, results=0):
+    return {
+        "parse": 16 * (channels + 1),  # pandas frame and column copies while a CSV is read
+        "time": 8,
+        "raw": channels * itemsize,
+        "filtered": channels * itemsize,
+        "results": results * channels * itemsize,
+        "filter_scratch": 24,  # padded float64 row copies inside sosfiltfilt, one channel at a time
+        "masks": 2,  # Stage 2 blink mask and scratch
+        "plot": 16 * 3 * channels,  # float64 x/y of the raw and filtered lines in both stages
+    }
+
+
+# Parts that stay in RAM under each strategy; memory-mapped raw data is paged
+# by the OS and chunked loading never holds the whole parse
+RESIDENT = {
+    "memory": ("parse", "time", "raw", "filtered", "results", "filter_scratch", "masks", "plot"),
+    "mmap": ("time", "filtered", "results", "filter_scratch", "masks", "plot"),
+    "chunked": ("time", "raw", "filtered", "results", "filter_scratch", "masks", "plot"),
+}
+
+
+class Footprint:
+    """Estimated memory use of a recording, per part and per strategy."""
+
+    def __init__(self, rows, channels=len(CHANNELS), itemsize=8, results=0):
+        self.rows = rows
+        self.costs = row_costs(channels, itemsize, results)
+
+    def parts(self, strategy="memory", factor=1):
+        rows = -(-self.rows // factor)
+        return {part: rows * self.costs[part] for part in RESIDENT[strategy]}
+
+    def total(self, strategy="memory", factor=1):
+        return sum(self.parts(strategy, factor).values())
+
+
+def estimate_footprint(path, channels=CHANNELS, precision=None, results=0):
+    return Footprint(count_rows(path), len(channels), np.dtype(sample_dtype(precision)).itemsize, results)
+
+
+Plan = namedtuple("Plan", ["strategy", "factor", "footprint", "budget"])
+
+
+def plan_load(footprint, budget=None):
+    """Cheapest strategy whose resident footprint fits the budget.
+
+    Chunked loading averages blocks of factor samples, with factor the
+    smallest power of two that fits.
+    """
+    budget = default_budget() if budget is None else budget
+    for strategy in ("memory", "mmap"):
+        if footprint.total(strategy) <= budget:
+            return Plan(strategy, 1, footprint, budget)
+    factor = 2
+    while footprint.total("chunked", factor) > budget and factor < footprint.rows:
+        factor *= 2
+    return Plan("chunked", factor, footprint, budget)
+
+
+Loaded = namedtuple("Loaded", ["time", "raw", "fs", "plan"])
+
+
+def _load_mmap(path, channels, precision, rows, directory):
+    # Parsed once into .npy files named by content, then reopened read-only.
+    # rows is an upper bound (blank lines count); only the filled rows are kept
+    os.makedirs(directory, exist_ok=True)
+    dtype = sample_dtype(precision)
+    stem = os.path.join(directory, f"{file_hash(path)}_{'-'.join(channels)}_{np.dtype(dtype).name}_v{CACHE_VERSION}")
+    time_path, raw_path = stem + "_time.npy", stem + "_raw.npy"
+    if not (os.path.exists(time_path) and os.path.exists(raw_path)):
+        tmp = f"{stem}.{os.getpid()}.tmp.npy"
+        time = np.empty(rows)
+        raw = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(len(channels), rows))
+        start = 0
+        for block_time, block in iter_recording(path, channels, precision=precision):
+            time[start:start + len(block_time)] = block_time
+            raw[:, start:start + len(block_time)] = block
+            start += len(block_time)
+        raw.flush()
+        del raw
+        np.save(time_path, time[:start])
+        os.replace(tmp, raw_path)
+    time = np.load(time_path)
+    return time, np.load(raw_path, mmap_mode="r")[:, :len(time)]
+
+
+def _load_chunked(path, channels, precision, factor):
+    # Block means of factor samples; chunk sizes are multiples of factor so
+    # blocks never straddle chunks
+    chunk_rows = max(1 << 16, factor) // factor * factor
+    times, blocks = [], []
+    carry_time, carry = np.empty(0), np.empty((len(channels), 0))
+    for block_time, block in iter_recording(path, channels, chunk_rows, precision):
+        if len(carry_time):
+            block_time = np.concatenate([carry_time, block_time])
+            block = np.hstack([carry, block])
+        usable = len(block_time) // factor * factor
+        carry_time, carry = block_time[usable:], block[:, usable:]
+        times.append(block_time[:usable:factor])
+        blocks.append(block[:, :usable].reshape(len(channels), -1, factor).mean(axis=-1))
+    if len(carry_time):
+        times.append(carry_time[:1])
+        blocks.append(carry.mean(axis=-1, keepdims=True))
+    dtype = sample_dtype(precision)
+    if not times:
+        return np.empty(0), np.empty((len(channels), 0), dtype=dtype)
+    return np.concatenate(times), np.hstack(blocks).astype(dtype, copy=False)
+
+
+# (time, raw) with blocks of factor samples averaged; factor 1 loads as is
+def load_averaged(path, factor=1, channels=CHANNELS, precision=None):
+    if factor == 1:
+        return load_recording(path, channels, precision=precision)
+    return _load_chunked(path, channels, precision, factor)
+
+
+def load_with_budget(path, fs=256, budget=None, channels=CHANNELS, precision=None, mmap_dir=MMAP_DIR):
+    """Load a recording in the way its estimated footprint allows.
+
+    Returns Loaded(time, raw, fs, plan). Under the chunked strategy fs is
+    the reduced sample rate of the averaged samples.
+    """
+    plan = plan_load(estimate_footprint(path, channels, precision), budget)
+    return load_planned(path, plan, fs, channels, precision, mmap_dir)
+
+
+def load_planned(path, plan, fs=256, channels=CHANNELS, precision=None, mmap_dir=MMAP_DIR):
+    if plan.strategy == "memory":
+        time, raw = load_recording(path, channels, precision=precision)
+    elif plan.strategy == "mmap":
+        time, raw = _load_mmap(path, channels, precision, plan.footprint.rows, mmap_dir)
+    else:
+        time, raw = load_averaged(path, plan.factor, channels, precision)
+    return Loaded(time, raw, fs / plan.factor, plan)
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+# Restart the peak RSS counter where Linux allows it; elsewhere peaks are
+# since process start
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class MemoryReport:
+    """Peak resident memory of each named stage of a run."""
+
+    def __init__(self):
+        self.stages = []  # (name, rss_before, peak_during, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        reset_peak_rss()
+        before = current_rss()
+        start = clock.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, before, peak_rss(), clock.perf_counter() - start))
+
+    def format(self):
+        def mb(value):
+            return "?" if value is None else f"{value / 2 ** 20:.0f} MB"
+
+        return "\n".join(f"{name:>10}: peak {mb(peak)} (from {mb(before)}) in {seconds:.2f} s"
+                         for name, before, peak, seconds in self.stages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan and measure loading a recording within a memory budget.")
+    parser.add_argument("path")
+    parser.add_argument("--budget", default=None, help="e.g. 512M; EEGAME_MEMORY_BUDGET or half of free memory")
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--cutoff", type=float, default=30)
+    args = parser.parse_args()
+
+    from detection import detect_blinks, threshold_range
+    from filters import max_cutoff, standard_chain
+
+    # Planned as the GUI plans its first recording, after the cache's share
+    budget = parse_size(args.budget) if args.budget else default_budget()
+    footprint = estimate_footprint(args.path)
+    print(f"{footprint.rows} rows; budget {budget / 2 ** 20:.0f} MB, "
+          f"{(budget - cache_budget(budget)) / 2 ** 20:.0f} MB after the cache")
+    for strategy in STRATEGIES[:2]:
+        print(f"  {strategy}: {footprint.total(strategy) / 2 ** 20:.0f} MB")
+
+    report = MemoryReport()
+    with report.stage("load"):
+        loaded = load_with_budget(args.path, args.fs, budget - cache_budget(budget))
+    print(f"Strategy {loaded.plan.strategy}, factor {loaded.plan.factor}, fs {loaded.fs:g} Hz")
+    with report.stage("filter"):
+        filtered = standard_chain(loaded.fs, min(args.cutoff, max_cutoff(loaded.fs))).apply(loaded.raw)
+    with report.stage("detect"):
+        for row, channel in enumerate(CHANNELS):
+            detect_blinks(filtered[row], *threshold_range(channel))
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import os
+from detection import DEFAULT_REFRACTORY, refractory_samples, threshold_range
+from filters import FilterChain, standard_chain
+from fir import FIRFilter
+from recording import CHANNELS, DEFAULT_PRECISION
+
+# Bumped whenever a change to the processing alters results for the same settings
+CONFIG_VERSION = 4
+
+
+class PipelineConfig:
+    """Every setting that affects an exported result.
+
+    The fingerprint is a hash of the canonical JSON form, so equal settings
+    hash the same in every run and on every machine. Numbers are normalized
+    (30 and 30.0 are the same cutoff) and defaults are spelled out, so
+    changing a default later changes the fingerprint too. fs is the
+    recording's own rate; average > 1 means blocks of that many samples were
+    averaged before filtering, as memory-limited loads do. Threshold runs
+    closer than refractory seconds count as one blink.
+    """
+
+    def __init__(self, fs=256, cutoff=30, order=4, dc_removal=False, notch=None,
+                 thresholds=None, precision=None, fir_transition=None, channels=CHANNELS, average=1,
+                 refractory=DEFAULT_REFRACTORY):
+        self.fs = float(fs)
+        self.average = int(average)
+        self.cutoff = float(cutoff)
+        self.order = int(order)
+        self.dc_removal = bool(dc_removal)
+        self.notch = None if notch is None else float(notch)
+        self.channels = tuple(channels)
+        thresholds = thresholds or {channel: threshold_range(channel) for channel in self.channels}
+        self.thresholds = {channel: (float(thresholds[channel][0]), float(thresholds[channel][1]))
+                           for channel in self.channels}
+        self.precision = precision or DEFAULT_PRECISION
+        self.fir_transition = None if fir_transition is None else float(fir_transition)
+        self.refractory = float(refractory)
+
+    def to_dict(self):
+        return {
+            "version": CONFIG_VERSION,
+            "fs": self.fs,
+            "cutoff": self.cutoff,
+            "order": self.order,
+            "dc_removal": self.dc_removal,
+            "notch": self.notch,
+            "thresholds": {channel: list(band) for channel, band in self.thresholds.items()},
+            "precision": self.precision,
+            "fir_transition": self.fir_transition,
+            "channels": list(self.channels),
+            "average": self.average,
+            "refractory": self.refractory,
+        }
+
+    @classmethod
+    def from_chain(cls, chain, average=1, **settings):
+        """Config of a chain built by standard_chain, at the rate of averaged samples."""
+        values = {"fs": chain.fs * average, "average": average}
+        for kind, *params in chain.stages:
+            if kind == "highpass":
+                values["dc_removal"] = True
+            elif kind == "notch":
+                values["notch"] = params[0]
+            elif kind == "lowpass":
+                values["cutoff"], values["order"] = params
+        values.update(settings)
+        return cls(**values)
+
+    @classmethod
+    def from_dict(cls, values):
+        values = dict(values)
+        version = values.pop("version", CONFIG_VERSION)
+        if version != CONFIG_VERSION:
+            raise ValueError(f"config version {version} does not match {CONFIG_VERSION}")
+        return cls(**values)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True, separators=(",", ":"))
+
+    def fingerprint(self):
+        return hashlib.sha256(self.to_json().encode("utf-8")).hexdigest()[:16]
+
+    def replace(self, **changes):
+        values = self.to_dict()
+        values.pop("version")
+        values.update(changes)
+        return PipelineConfig(**values)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def rate(self):
+        """Sample rate of the filtered data, after averaging."""
+        return self.fs / self.average
+
+    def refractory_samples(self):
+        return refractory_samples(self.refractory, self.rate)
+
+    def chain(self):
+        return standard_chain(self.rate, self.cutoff, dc_removal=self.dc_removal,
+                              notch=self.notch, order=self.order)
+
+    def apply(self, raw):
+        chain = self.chain()
+        if self.fir_transition is None:
+            return chain.apply(raw)
+        # Linear-phase FIR low-pass in place of the Butterworth stage
+        filtered = FilterChain(self.rate, chain.stages[:-1]).apply(raw)
+        return FIRFilter(self.rate, self.cutoff, self.fir_transition).apply(filtered)
+
+    def __eq__(self, other):
+        return isinstance(other, PipelineConfig) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(self.to_json())
+
+    def __repr__(self):
+        return f"PipelineConfig({self.to_json()})"
+
+
+# Manifests record which input and which config produced a set of outputs,
+# so later runs can tell whether the outputs are still current
+def write_manifest(path, input_hash, config, outputs):
+    manifest = {
+        "input_hash": input_hash,
+        "config_hash": config.fingerprint(),
+        "config": config.to_dict(),
+        "outputs": [os.path.basename(output) for output in outputs],
+    }
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def manifest_matches(path, input_hash, config):
+    """True if path records input_hash and config, and all its outputs still exist."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("input_hash") != input_hash or manifest.get("config_hash") != config.fingerprint():
+        return False
+    directory = os.path.dirname(path)
+    return all(os.path.exists(os.path.join(directory, output)) for output in manifest.get("outputs", ()))
+
+
+# Provenance for PNG exports, stored as text chunks
+def image_metadata(config, input_hash=None):
+    return {
+        "Software": "EEGAME",
+        "Description": json.dumps({"input_hash": input_hash, "config_hash": config.fingerprint(),
+                                   "config": config.to_dict()}, sort_keys=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a pipeline config and its fingerprint.")
+    parser.add_argument("config", nargs="?", help="Config JSON; the defaults if omitted")
+    args = parser.parse_args()
+    config = PipelineConfig.load(args.config) if args.config else PipelineConfig()
+    print(json.dumps(config.to_dict(), indent=2, sort_keys=True))
+    print("fingerprint", config.fingerprint())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pandas as pd
+from storage import StoreReader
+from traces import minmax_decimate
+
+
+CHANNELS = ("FP1", "FP2")
+
+# Sample precision: float32 halves memory for samples and filtered outputs.
+# Time stays float64 and filters always run in float64 internally
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+DEFAULT_PRECISION = os.environ.get("EEGAME_PRECISION", "float64")
+
+
+def sample_dtype(precision=None):
+    precision = precision or DEFAULT_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {sorted(PRECISIONS)}")
+    return PRECISIONS[precision]
+
+
+# Time column and one row per channel as contiguous arrays
+def recording_arrays(eeg_data, channels=CHANNELS, precision=None):
+    time = eeg_data["Time (s)"].to_numpy(dtype=np.float64)
+    raw = np.empty((len(channels), len(time)), dtype=sample_dtype(precision))
+    for row, channel in enumerate(channels):
+        raw[row] = eeg_data[channel].to_numpy()
+    return time, raw
+
+
+# CSV exports or compressed column stores (.eegz)
+def load_recording(path, channels=CHANNELS, t0=None, t1=None, precision=None):
+    if path.endswith(".eegz"):
+        time, raw = StoreReader(path).read(t0, t1, columns=list(channels))
+        return time, raw.astype(sample_dtype(precision), copy=False)
+    eeg_data = pd.read_csv(path, usecols=["Time (s)", *channels])
+    time, raw = recording_arrays(eeg_data, channels, precision)
+    if t0 is None and t1 is None:
+        return time, raw
+    lo = 0 if t0 is None else np.searchsorted(time, t0, side="left")
+    hi = len(time) if t1 is None else np.searchsorted(time, t1, side="right")
+    return time[lo:hi], raw[:, lo:hi]
+
+
+# (time, raw) blocks of about chunk_rows samples, so a recording can be
+# processed without holding all of it
+def iter_recording(path, channels=CHANNELS, chunk_rows=1 << 16, precision=None):
+    dtype = sample_dtype(precision)
+    if path.endswith(".eegz"):
+        for time, raw in StoreReader(path).iter_chunks(columns=list(channels)):
+            yield time, raw.astype(dtype, copy=False)
+        return
+    for eeg_data in pd.read_csv(path, usecols=["Time (s)", *channels], chunksize=chunk_rows):
+        yield recording_arrays(eeg_data, channels, precision)
+
+
+# Exact number of samples; CSV rows are counted without parsing them
+def count_rows(path):
+    if path.endswith(".eegz"):
+        return len(StoreReader(path))
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+
+# A quick look at a whole recording: about points evenly spaced CSV rows,
+# read by seeking so the cost does not grow with the file. Small files and
+# .eegz stores are loaded in full and min/max decimated instead
+def preview_recording(path, points=2000, channels=CHANNELS, precision=None):
+    if not path.endswith(".eegz") and os.path.getsize(path) > 64 * points:
+        with open(path, "rb") as f:
+            header = f.readline().decode("utf-8-sig").strip().split(",")
+            columns = [header.index(name) for name in ("Time (s)", *channels)]
+            start = f.tell()
+            size = os.fstat(f.fileno()).st_size
+            rows = []
+            for offset in np.linspace(start, size, points, endpoint=False).astype(np.int64):
+                f.seek(offset)
+                if offset > start:
+                    f.readline()  # Skip the partial line
+                fields = f.readline().split(b",")
+                if len(fields) == len(header):
+                    rows.append([float(fields[c]) for c in columns])
+        values = np.unique(np.array(rows, dtype=np.float64).reshape(-1, len(columns)), axis=0)
+        return values[:, 0], values[:, 1:].T.astype(sample_dtype(precision))
+    time, raw = load_recording(path, channels, precision=precision)
+    return minmax_decimate(time, raw, points)
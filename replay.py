@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import queue
+import threading
+import time as clock
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from recording import CHANNELS
+
+# One block of samples: time is (n,), data is (channels, n)
+Block = namedtuple("Block", ["time", "data"])
+
+_END = object()
+
+
+class ReplaySource:
+    """Streams a recording CSV in blocks paced by its 'Time (s)' column.
+
+    speed=1 replays in real time, speed=N runs N times faster and
+    speed=None emits as fast as the consumer takes blocks. The file is read
+    lazily in chunks of chunk_rows. Blocks go through a bounded queue: when
+    it is full the reader waits (backpressure), or with drop=True discards
+    the block and counts it in dropped_blocks.
+    """
+
+    def __init__(self, path, speed=1.0, chunk_rows=256, queue_size=16, drop=False, channels=CHANNELS):
+        self.path = path
+        self.speed = speed
+        self.chunk_rows = chunk_rows
+        self.drop = drop
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.emitted_blocks = 0
+        self.emitted_samples = 0
+        self.dropped_blocks = 0
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="replay", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _blocks(self):
+        columns = ["Time (s)", *self.channels]
+        reader = pd.read_csv(self.path, usecols=columns, chunksize=self.chunk_rows)
+        for chunk in reader:
+            time = chunk["Time (s)"].to_numpy(dtype=np.float64)
+            data = chunk[list(self.channels)].to_numpy(dtype=np.float64).T.copy()
+            yield Block(time, data)
+
+    def _run(self):
+        self.started_at = clock.perf_counter()
+        t0 = None
+        try:
+            for block in self._blocks():
+                if self._stop.is_set():
+                    break
+                if self.speed:
+                    # Wait until the block's first sample is due
+                    if t0 is None:
+                        t0 = block.time[0]
+                    due = self.started_at + (block.time[0] - t0) / self.speed
+                    delay = due - clock.perf_counter()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                self._put(block)
+        finally:
+            self.finished_at = clock.perf_counter()
+            self._put_end()
+
+    def _put(self, block):
+        if self.drop:
+            try:
+                self.queue.put_nowait(block)
+            except queue.Full:
+                self.dropped_blocks += 1
+                return
+        else:
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(block, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                return
+        self.emitted_blocks += 1
+        self.emitted_samples += len(block.time)
+
+    def _put_end(self):
+        while True:
+            try:
+                self.queue.put(_END, timeout=0.1)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    return
+
+    def __iter__(self):
+        self.start()
+        while True:
+            block = self.queue.get()
+            if block is _END:
+                return
+            yield block
+
+    async def __aiter__(self):
+        self.start()
+        loop = asyncio.get_running_loop()
+        while True:
+            block = await loop.run_in_executor(None, self.queue.get)
+            if block is _END:
+                return
+            yield block
+
+    @property
+    def samples_per_second(self):
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at or clock.perf_counter()
+        elapsed = end - self.started_at
+        return self.emitted_samples / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            "blocks": self.emitted_blocks,
+            "samples": self.emitted_samples,
+            "dropped_blocks": self.dropped_blocks,
+            "samples_per_second": self.samples_per_second,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an EEG CSV and report throughput.")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay rate, 0 for max speed")
+    parser.add_argument("--chunk-rows", type=int, default=256)
+    parser.add_argument("--drop", action="store_true", help="Drop blocks instead of waiting when the queue is full")
+    parser.add_argument("--detect", action="store_true", help="Filter and detect blinks as blocks arrive")
+    args = parser.parse_args()
+
+    source = ReplaySource(args.path, speed=args.speed or None, chunk_rows=args.chunk_rows, drop=args.drop)
+    if args.detect:
+        from engine import Engine, stream
+        from pipeline import PipelineConfig
+
+        engine = Engine()
+        try:
+            session = asyncio.run(stream(engine, source, PipelineConfig()))
+        finally:
+            engine.shutdown()
+        for channel, summary in session.summary()["channels"].items():
+            print(f"{channel}: {summary['blinks']} blinks")
+    else:
+        for _ in source:
+            pass
+    print(source.stats())
+
+
+if __name__ == "__main__":
+    main()
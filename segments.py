@@ -0,0 +1,115 @@
+import argparse
+import numpy as np
+from detection import DEFAULT_REFRACTORY, detect_events, refractory_samples, threshold_range
+from filters import standard_chain
+from recording import CHANNELS, load_recording
+
+
+class EventIndex:
+    """Blink events of a session in sorted arrays for logarithmic lookups.
+
+    Events of all channels are merged and sorted by onset. A running maximum
+    of the offsets makes overlap queries a binary search even when events of
+    different channels overlap. channel holds each event's channel index.
+    """
+
+    def __init__(self, onsets, offsets, peaks, channel, channels=CHANNELS):
+        order = np.argsort(onsets, kind="stable")
+        self.onsets = np.asarray(onsets, dtype=np.float64)[order]
+        self.offsets = np.asarray(offsets, dtype=np.float64)[order]
+        self.peaks = np.asarray(peaks, dtype=np.float64)[order]
+        self.channel = np.asarray(channel, dtype=np.intp)[order]
+        self.channels = tuple(channels)
+        self._reach = np.maximum.accumulate(self.offsets) if len(self.offsets) else self.offsets
+        self._densest = {}
+
+    @classmethod
+    def from_events(cls, events, channels=CHANNELS):
+        """events maps channel -> (onsets, offsets, peaks) as from detect_events."""
+        parts = [events[channel] for channel in channels]
+        return cls(
+            np.concatenate([p[0] for p in parts]),
+            np.concatenate([p[1] for p in parts]),
+            np.concatenate([p[2] for p in parts]),
+            np.concatenate([np.full(len(p[0]), row) for row, p in enumerate(parts)]),
+            channels,
+        )
+
+    def __len__(self):
+        return len(self.onsets)
+
+    def next_event(self, t):
+        """Index of the first event starting after t, or None."""
+        i = np.searchsorted(self.onsets, t, side="right")
+        return int(i) if i < len(self) else None
+
+    def previous_event(self, t):
+        """Index of the last event starting before t, or None."""
+        i = np.searchsorted(self.onsets, t, side="left") - 1
+        return int(i) if i >= 0 else None
+
+    def between(self, t0, t1):
+        """Indices of events overlapping [t0, t1]."""
+        lo = np.searchsorted(self._reach, t0, side="left")
+        hi = np.searchsorted(self.onsets, t1, side="right")
+        candidates = np.arange(lo, max(lo, hi))
+        return candidates[self.offsets[candidates] >= t0]
+
+    def densest(self, width=60.0):
+        """(start, count) of the width-second window holding the most onsets.
+
+        Windows start at an onset; the answer is computed once per width.
+        """
+        if width not in self._densest:
+            if not len(self):
+                self._densest[width] = (None, 0)
+            else:
+                ends = np.searchsorted(self.onsets, self.onsets + width, side="left")
+                counts = ends - np.arange(len(self))
+                i = int(np.argmax(counts))
+                self._densest[width] = (float(self.onsets[i]), int(counts[i]))
+        return self._densest[width]
+
+    def save(self, path):
+        np.savez(path, onsets=self.onsets, offsets=self.offsets, peaks=self.peaks,
+                 channel=self.channel, channels=np.array(self.channels))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls(saved["onsets"], saved["offsets"], saved["peaks"], saved["channel"],
+                       tuple(str(c) for c in saved["channels"]))
+
+
+# Index of every channel's events for one filtered recording, runs closer
+# than refractory samples merged; callers that already ran a SessionStats
+# pass use EventIndex.from_events(stats.events())
+def build_index(time, filtered, thresholds, channels=CHANNELS, refractory=0):
+    events = {channel: detect_events(time, filtered[row], *thresholds[channel], refractory)
+              for row, channel in enumerate(channels)}
+    return EventIndex.from_events(events, channels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the blink event index of a recording.")
+    parser.add_argument("path")
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--cutoff", type=float, default=30)
+    parser.add_argument("--refractory", type=float, default=DEFAULT_REFRACTORY,
+                        help="Threshold runs closer than this (s) are one blink")
+    parser.add_argument("--save", default=None, help="Write the index to this .npz file")
+    args = parser.parse_args()
+
+    time, raw = load_recording(args.path)
+    filtered = standard_chain(args.fs, args.cutoff).apply(raw)
+    index = build_index(time, filtered, {channel: threshold_range(channel) for channel in CHANNELS},
+                        refractory=refractory_samples(args.refractory, args.fs))
+    start, count = index.densest(60.0)
+    print(f"{len(index)} events; densest minute starts at {start} s with {count} blinks")
+    if args.save:
+        index.save(args.save)
+        assert np.array_equal(EventIndex.load(args.save).onsets, index.onsets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import threading
+import time as clock
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from cache import ResultCache, file_hash, make_key
+from detection import detect_blinks, threshold_range
+from figures import render_png, stage1_figure, stage2_figure
+from filters import standard_chain
+from recording import CHANNELS, load_recording, sample_dtype
+from traces import minmax_decimate
+
+
+class AnalysisService:
+    """Filter, detect and trace requests backed by one shared cache.
+
+    Recordings are opened by path relative to data_dir. Compute runs on a
+    pool of workers. Identical requests that arrive together share a single
+    computation.
+    """
+
+    def __init__(self, data_dir=".", workers=None, cache=None):
+        self.data_dir = os.path.abspath(data_dir)
+        self.cache = cache if cache is not None else ResultCache()
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                       thread_name_prefix="analysis")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _compute(self, key, compute):
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            value = self.cache.put(key, self.pool.submit(compute).result())
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def load(self, path):
+        full_path = os.path.abspath(os.path.join(self.data_dir, path))
+        if os.path.commonpath([self.data_dir, full_path]) != self.data_dir:
+            raise ValueError("path must be inside the data directory")
+        source = file_hash(full_path)
+        time, raw = self._compute(make_key("raw", source, sample_dtype().__name__),
+                                  lambda: load_recording(full_path))
+        return {"source": source, "samples": len(time), "channels": list(CHANNELS)}
+
+    def _raw(self, source):
+        recording = self.cache.get(make_key("raw", source, sample_dtype().__name__))
+        if recording is None:
+            raise KeyError(f"unknown source {source!r}, load it first")
+        return recording
+
+    def filtered(self, source, fs, cutoff, dc_removal=False, notch=None, order=4):
+        time, raw = self._raw(source)
+        chain = standard_chain(fs, cutoff, dc_removal=dc_removal, notch=notch, order=order)
+        key = make_key("filtered", source, raw.dtype.name, fs, chain.stages)
+        return time, self._compute(key, lambda: chain.apply(raw)), key
+
+    def trace(self, source, fs, cutoff, points=2000, **options):
+        time, filtered, key = self.filtered(source, fs, cutoff, **options)
+        t, data = self._compute(make_key("trace", key, points),
+                                lambda: minmax_decimate(time, filtered, points))
+        # Each channel keeps its own min/max samples, so each has its own times
+        return {"time": {ch: times.tolist() for ch, times in zip(CHANNELS, t)},
+                "channels": {ch: row.tolist() for ch, row in zip(CHANNELS, data)}}
+
+    def detect(self, source, fs, cutoff, thresholds, **options):
+        time, filtered, key = self.filtered(source, fs, cutoff, **options)
+        events = {}
+        for row, channel in enumerate(CHANNELS):
+            lower, upper = thresholds[channel]
+            idx = self._compute(make_key("events", key, row, lower, upper),
+                                lambda: detect_blinks(filtered[row], lower, upper))
+            events[channel] = time[idx].tolist()
+        return {"events": events}
+
+    # thresholds maps channel -> (lower, upper) for Stage 2; each channel's
+    # default range if not given
+    def figure(self, source, fs, cutoff, stage=1, dpi=100, thresholds=None, **options):
+        time, filtered, key = self.filtered(source, fs, cutoff, **options)
+        if stage == 1:
+            thresholds = None
+        elif thresholds is None:
+            thresholds = {channel: threshold_range(channel) for channel in CHANNELS}
+
+        def render():
+            if stage == 1:
+                return render_png(stage1_figure(time, self._raw(source)[1], filtered), dpi=dpi)
+            return render_png(stage2_figure(time, filtered, thresholds), dpi=dpi)
+
+        bands = None if thresholds is None else tuple(tuple(thresholds[channel]) for channel in CHANNELS)
+        return self._compute(make_key("figure", key, stage, dpi, bands), render)
+
+    def stats(self):
+        return {"cache_hits": self.cache.hits, "cache_misses": self.cache.misses}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+# Per-channel (lower, upper) thresholds from a parsed query string, e.g.
+# fp1_lower and fp1_upper; None if the query gives none and optional is set
+def query_thresholds(query, optional=False):
+    names = [f"{channel.lower()}_{bound}" for channel in CHANNELS for bound in ("lower", "upper")]
+    if optional and not any(name in query for name in names):
+        return None
+    return {
+        channel: (float(query[f"{channel.lower()}_lower"][0]),
+                  float(query[f"{channel.lower()}_upper"][0]))
+        for channel in CHANNELS
+    }
+
+
+# Common filter options from a parsed query string
+def filter_options(query):
+    def get(name, default):
+        return query.get(name, [default])[0]
+
+    notch = int(get("notch", 0))
+    return {
+        "fs": float(get("fs", 256)),
+        "cutoff": float(get("cutoff", 30)),
+        "dc_removal": get("dc", "0") == "1",
+        "notch": notch or None,
+        "order": int(get("order", 4)),
+    }
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            if url.path == "/load":
+                body = self.service.load(query["path"][0])
+            elif url.path == "/trace":
+                body = self.service.trace(query["source"][0], points=int(query.get("points", [2000])[0]),
+                                          **filter_options(query))
+            elif url.path == "/detect":
+                body = self.service.detect(query["source"][0], thresholds=query_thresholds(query),
+                                           **filter_options(query))
+            elif url.path == "/figure":
+                png = self.service.figure(query["source"][0], stage=int(query.get("stage", [1])[0]),
+                                          dpi=int(query.get("dpi", [100])[0]),
+                                          thresholds=query_thresholds(query, optional=True),
+                                          **filter_options(query))
+                self.send_body(200, "image/png", png)
+                return
+            elif url.path == "/stats":
+                body = self.service.stats()
+            else:
+                self.send_json(404, {"error": f"unknown endpoint {url.path}"})
+                return
+        except (KeyError, ValueError, OSError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            # Anything else is the server's fault; the client still gets an answer
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, body)
+
+    def send_json(self, status, body):
+        self.send_body(status, "application/json", json.dumps(body).encode("utf-8"))
+
+    def send_body(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    handler = type("BoundAnalysisHandler", (AnalysisHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class AnalysisClient:
+    """Thin client for AnalysisService over HTTP."""
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _get(self, endpoint, **params):
+        query = urllib.parse.urlencode(params)
+        with urllib.request.urlopen(f"{self.url}/{endpoint}?{query}", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def load(self, path):
+        return self._get("load", path=path)
+
+    def trace(self, source, cutoff, **params):
+        return self._get("trace", source=source, cutoff=cutoff, **params)
+
+    def detect(self, source, cutoff, **params):
+        return self._get("detect", source=source, cutoff=cutoff, **params)
+
+    def stats(self):
+        return self._get("stats")
+
+
+# Simulate N classroom clients hammering one server
+def run_load_test(url, path, clients=30, requests=10, cutoffs=(10, 20, 30)):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client_session(index):
+        client = AnalysisClient(url)
+        try:
+            source = client.load(path)["source"]
+            for i in range(requests):
+                cutoff = cutoffs[(index + i) % len(cutoffs)]
+                start = clock.perf_counter()
+                client.trace(source, cutoff, points=2000)
+                client.detect(source, cutoff, fp1_lower=8400, fp1_upper=8600,
+                              fp2_lower=-8500, fp2_upper=-8300)
+                with lock:
+                    latencies.append(clock.perf_counter() - start)
+        except (urllib.error.URLError, OSError) as e:
+            with lock:
+                errors.append(str(e))
+
+    start = clock.perf_counter()
+    threads = [threading.Thread(target=client_session, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = clock.perf_counter() - start
+
+    result = {"clients": clients, "rounds": len(latencies), "errors": len(errors),
+              "elapsed_s": elapsed, "rounds_per_s": len(latencies) / elapsed}
+    if latencies:
+        result["p50_ms"] = 1000 * float(np.percentile(latencies, 50))
+        result["p95_ms"] = 1000 * float(np.percentile(latencies, 95))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local EEG analysis server for classroom clients.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--data-dir", default="eeg-data")
+    serve.add_argument("--workers", type=int, default=None)
+
+    loadtest = subparsers.add_parser("loadtest")
+    loadtest.add_argument("--url", default=None, help="Server to test; starts a local one if omitted")
+    loadtest.add_argument("--data-dir", default="eeg-data")
+    loadtest.add_argument("--path", default="Ecog_waveform_2.csv")
+    loadtest.add_argument("--clients", type=int, default=30)
+    loadtest.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = make_server(AnalysisService(args.data_dir, args.workers), args.host, args.port)
+        print(f"Serving on http://{args.host}:{args.port}")
+        server.serve_forever()
+        return
+
+    server = None
+    url = args.url
+    if url is None:
+        server = make_server(AnalysisService(args.data_dir), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(run_load_test(url, args.path, args.clients, args.requests))
+    if server is not None:
+        print(server.RequestHandlerClass.service.stats())
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
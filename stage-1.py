@@ -2,10 +2,10 @@ import sys
 import numpy as np
 import pandas as pd
 from scipy.signal import butter, filtfilt
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import QApplication, QVBoxLayout, QHBoxLayout, QSlider, QWidget, QLabel, QPushButton
 from PyQt5.QtCore import Qt
+from figures import new_figure
 
 
 # Butterworth low-pass filter
@@ -41,8 +41,7 @@ class EEGDenoisingApp(QWidget):
         main_layout.addWidget(self.label)
 
         # Add a Matplotlib figure
-        self.figure, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(8, 6))
-        self.figure.tight_layout(pad=3)
+        self.figure, (self.ax1, self.ax2) = new_figure(figsize=(8, 6))
         self.canvas = FigureCanvas(self.figure)
         main_layout.addWidget(self.canvas)
 
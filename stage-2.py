@@ -1,12 +1,12 @@
 import sys
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import (
     QApplication, QVBoxLayout, QHBoxLayout, QSlider, QWidget, QLabel, QLineEdit
 )
 from PyQt5.QtCore import Qt
+from figures import new_figure
 
 
 class BlinkDetectionApp(QWidget):
@@ -40,8 +40,7 @@ class BlinkDetectionApp(QWidget):
         main_layout = QVBoxLayout()
 
         # Add Matplotlib figure
-        self.figure, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(8, 10))
-        self.figure.tight_layout(pad=3)
+        self.figure, (self.ax1, self.ax2) = new_figure(figsize=(8, 10))
         self.canvas = FigureCanvas(self.figure)
         main_layout.addWidget(self.canvas)
 
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+from detection import COINCIDENCE_TOLERANCE, StreamingDetector, coincident_events
+
+
+class RunningStats:
+    """Count, mean, variance, min and max updated one batch at a time."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        n = len(values)
+        if n == 0:
+            return
+        # Chan et al. pairwise merge of the batch into the running moments
+        batch_mean = values.mean()
+        batch_m2 = np.square(values - batch_mean).sum()
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += batch_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+
+class HistogramSketch:
+    """Fixed-bin histogram with open-ended under/overflow bins.
+
+    Memory is constant in the number of values. Quantiles are interpolated
+    within a bin, so they are accurate to one bin width.
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+
+    @classmethod
+    def linear(cls, lo, hi, bins=256):
+        return cls(np.linspace(lo, hi, bins + 1))
+
+    @classmethod
+    def log(cls, lo, hi, bins=256):
+        return cls(np.geomspace(lo, hi, bins + 1))
+
+    def update(self, values):
+        idx = np.searchsorted(self.edges, np.asarray(values, dtype=np.float64).ravel(), side="right")
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+
+    def quantile(self, q):
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+        target = q * total
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, target, side="left"))
+        if i == 0:
+            return self.edges[0]
+        if i == len(self.counts) - 1:
+            return self.edges[-1]
+        before = cumulative[i - 1]
+        fraction = (target - before) / max(self.counts[i], 1)
+        return self.edges[i - 1] + fraction * (self.edges[i] - self.edges[i - 1])
+
+
+class ChannelStats:
+    """Blink statistics for one channel from a single pass over its blocks.
+
+    The events themselves are kept too (a few numbers per blink), so joins
+    and indexes over them need no further pass over the samples.
+    """
+
+    def __init__(self, lower, upper, refractory=0):
+        self.detector = StreamingDetector(lower, upper, refractory)
+        self.signal = RunningStats()
+        self.peaks = RunningStats()
+        self.durations = RunningStats()
+        self.intervals = RunningStats()
+        self.peak_histogram = HistogramSketch.linear(0, 16384, bins=512)
+        self.interval_histogram = HistogramSketch.log(0.01, 600)
+        self.start_time = None
+        self.end_time = None
+        self._last_onset = None
+        self._events = []
+
+    def feed(self, time, data):
+        if len(time) == 0:
+            return
+        if self.start_time is None:
+            self.start_time = float(time[0])
+        self.end_time = float(time[-1])
+        self.signal.update(data)
+        self._add_events(*self.detector.feed(time, data))
+
+    def finish(self):
+        self._add_events(*self.detector.finish())
+
+    def _add_events(self, onsets, offsets, peaks):
+        if not len(onsets):
+            return
+        self._events.append((onsets, offsets, peaks))
+        self.peaks.update(peaks)
+        self.peak_histogram.update(peaks)
+        self.durations.update(offsets - onsets)
+        if self._last_onset is not None:
+            onsets_with_last = np.concatenate([[self._last_onset], onsets])
+        else:
+            onsets_with_last = onsets
+        gaps = np.diff(onsets_with_last)
+        self.intervals.update(gaps)
+        self.interval_histogram.update(gaps)
+        self._last_onset = onsets[-1]
+
+    def events(self):
+        """(onsets, offsets, peaks) of every event so far, as from detect_events."""
+        if not self._events:
+            return np.empty(0), np.empty(0), np.empty(0)
+        return tuple(np.concatenate(part) for part in zip(*self._events))
+
+    def summary(self):
+        duration = (self.end_time - self.start_time) if self.start_time is not None else 0.0
+        return {
+            "blinks": self.peaks.count,
+            "duration_s": duration,
+            "blinks_per_min": 60.0 * self.peaks.count / duration if duration > 0 else 0.0,
+            "ibi_mean_s": self.intervals.mean if self.intervals.count else np.nan,
+            "ibi_std_s": self.intervals.std if self.intervals.count else np.nan,
+            "ibi_median_s": self.interval_histogram.quantile(0.5),
+            "blink_duration_mean_s": self.durations.mean if self.durations.count else np.nan,
+            "peak_mean": self.peaks.mean if self.peaks.count else np.nan,
+            "peak_std": self.peaks.std if self.peaks.count else np.nan,
+            "peak_p50": self.peak_histogram.quantile(0.5),
+            "peak_p95": self.peak_histogram.quantile(0.95),
+            "signal_mean": self.signal.mean,
+            "signal_std": self.signal.std,
+            "signal_min": self.signal.min,
+            "signal_max": self.signal.max,
+        }
+
+
+class SessionStats:
+    """Per-channel and per-session blink statistics for a recording.
+
+    thresholds maps each channel name to (lower, upper); threshold runs
+    closer than refractory samples count as one blink. Feed blocks of
+    (time, data) with one row per channel, in channel order, then call
+    finish() before reading summary(). The session's blinks are the events
+    coincident on the first two channels.
+    """
+
+    def __init__(self, thresholds, refractory=0):
+        self.channels = list(thresholds)
+        self.stats = {channel: ChannelStats(*thresholds[channel], refractory) for channel in self.channels}
+
+    def feed(self, time, data):
+        for channel, row in zip(self.channels, np.atleast_2d(data)):
+            self.stats[channel].feed(time, row)
+
+    def feed_blocks(self, blocks):
+        for time, data in blocks:
+            self.feed(time, data)
+        self.finish()
+        return self
+
+    def finish(self):
+        for stats in self.stats.values():
+            stats.finish()
+
+    def events(self):
+        """channel -> (onsets, offsets, peaks) of the events detected in the pass."""
+        return {channel: self.stats[channel].events() for channel in self.channels}
+
+    def coincidences(self, tolerance=COINCIDENCE_TOLERANCE):
+        """Joint events of the first two channels, or None for a single channel."""
+        if len(self.channels) < 2:
+            return None
+        return coincident_events(self.stats[self.channels[0]].events(),
+                                 self.stats[self.channels[1]].events(), tolerance)
+
+    def summary(self):
+        channels = {channel: self.stats[channel].summary() for channel in self.channels}
+        # One eye blink shows on both frontal channels, so the session counts
+        # joint events rather than adding up the channels
+        joint = self.coincidences()
+        total = channels[self.channels[0]]["blinks"] if joint is None else len(joint.onset)
+        duration = max((summary["duration_s"] for summary in channels.values()), default=0.0)
+        session = {
+            "blinks": total,
+            "duration_s": duration,
+            "blinks_per_min": 60.0 * total / duration if duration > 0 else 0.0,
+        }
+        return {"channels": channels, "session": session}
+
+    def to_frame(self):
+        summary = self.summary()
+        rows = [{"channel": channel, **values} for channel, values in summary["channels"].items()]
+        rows.append({"channel": "session", **summary["session"]})
+        return pd.DataFrame(rows)
+
+
+# Split (time, data) into blocks so callers can reuse the streaming path
+def iter_blocks(time, data, block_size=1 << 16):
+    for start in range(0, len(time), block_size):
+        yield time[start:start + block_size], data[:, start:start + block_size]
@@ -0,0 +1,243 @@
+import argparse
+import bisect
+import json
+import os
+import struct
+import time as clock
+import zlib
+import numpy as np
+import pandas as pd
+
+
+MAGIC = b"EEGZ1\n"
+TRAILER = struct.Struct("<Q")
+
+# Quantization step per column kind; ADC samples around ±8e3 keep 0.01 μV
+TIME_STEP = 1e-6
+SAMPLE_STEP = 1e-2
+
+
+def _encode(values, step, level):
+    # Quantize, delta encode against the first value, byte-shuffle the
+    # int32 deltas, then compress. The first value is kept in the index
+    q = np.rint(np.asarray(values, dtype=np.float64) / step).astype(np.int64)
+    deltas = np.diff(q, prepend=q[0])
+    if deltas.min() < np.iinfo(np.int32).min or deltas.max() > np.iinfo(np.int32).max:
+        raise ValueError("values out of range for the quantization step")
+    shuffled = deltas.astype("<i4").view(np.uint8).reshape(-1, 4).T.copy()
+    return int(q[0]), zlib.compress(shuffled.tobytes(), level)
+
+
+def _decode(payload, first, rows, step):
+    shuffled = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(4, rows)
+    deltas = shuffled.T.copy().view("<i4").ravel()
+    return (first + np.cumsum(deltas, dtype=np.int64)) * step
+
+
+class StoreWriter:
+    """Appends blocks of samples to a chunked, compressed column store.
+
+    The first column is time. Every chunk_rows rows form one chunk holding
+    each column quantized to its step, delta encoded and zlib compressed.
+    A JSON index of chunk offsets and time ranges is written on close().
+    """
+
+    def __init__(self, path, columns, chunk_rows=1 << 16, steps=None, level=1, metadata=None):
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.steps = list(steps) if steps else [TIME_STEP] + [SAMPLE_STEP] * (len(self.columns) - 1)
+        self.level = level
+        self.metadata = metadata or {}
+        self.chunks = []
+        self._pending = []
+        self._pending_rows = 0
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+
+    def append(self, time, data):
+        """Append time (n,) and data (columns - 1, n)."""
+        block = np.vstack([np.asarray(time, dtype=np.float64)[None, :], np.atleast_2d(data)])
+        self._pending.append(block)
+        self._pending_rows += block.shape[1]
+        if self._pending_rows >= self.chunk_rows:
+            pending = np.hstack(self._pending)
+            full = (pending.shape[1] // self.chunk_rows) * self.chunk_rows
+            for start in range(0, full, self.chunk_rows):
+                self._write_chunk(pending[:, start:start + self.chunk_rows])
+            self._pending = [pending[:, full:]]
+            self._pending_rows = pending.shape[1] - full
+
+    def _write_chunk(self, block):
+        rows = block.shape[1]
+        if rows == 0:
+            return
+        firsts, lengths = [], []
+        offset = self._file.tell()
+        for values, step in zip(block, self.steps):
+            first, payload = _encode(values, step, self.level)
+            self._file.write(payload)
+            firsts.append(first)
+            lengths.append(len(payload))
+        self.chunks.append({
+            "offset": offset,
+            "rows": rows,
+            "firsts": firsts,
+            "lengths": lengths,
+            "t_start": float(block[0, 0]),
+            "t_end": float(block[0, -1]),
+        })
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._pending_rows:
+            self._write_chunk(np.hstack(self._pending))
+        self._pending = []
+        index = {
+            "columns": self.columns,
+            "steps": self.steps,
+            "chunk_rows": self.chunk_rows,
+            "chunks": self.chunks,
+            "metadata": self.metadata,
+        }
+        index_offset = self._file.tell()
+        self._file.write(json.dumps(index).encode("utf-8"))
+        self._file.write(TRAILER.pack(index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StoreReader:
+    """Reads a column store, decompressing only the chunks a query needs."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an EEG column store")
+            f.seek(-TRAILER.size, os.SEEK_END)
+            end = f.tell()
+            (index_offset,) = TRAILER.unpack(f.read(TRAILER.size))
+            f.seek(index_offset)
+            index = json.loads(f.read(end - index_offset))
+        self.columns = index["columns"]
+        self.steps = index["steps"]
+        self.chunks = index["chunks"]
+        self.metadata = index.get("metadata", {})
+        self._t_starts = [chunk["t_start"] for chunk in self.chunks]
+        self._t_ends = [chunk["t_end"] for chunk in self.chunks]
+
+    def __len__(self):
+        return sum(chunk["rows"] for chunk in self.chunks)
+
+    def _read_chunk(self, f, chunk, wanted):
+        f.seek(chunk["offset"])
+        payloads = [f.read(length) for length in chunk["lengths"]]
+
+        def column(i):
+            return _decode(payloads[i], chunk["firsts"][i], chunk["rows"], self.steps[i])
+
+        return column(0), np.vstack([column(i) for i in wanted])
+
+    def iter_chunks(self, columns=None):
+        """Yield (time, data) one stored chunk at a time."""
+        names = columns or self.columns[1:]
+        wanted = [self.columns.index(name) for name in names]
+        with open(self.path, "rb") as f:
+            for chunk in self.chunks:
+                yield self._read_chunk(f, chunk, wanted)
+
+    def read(self, t0=None, t1=None, columns=None):
+        """Return (time, data) for samples with t0 <= time <= t1."""
+        names = columns or self.columns[1:]
+        wanted = [self.columns.index(name) for name in names]
+        first = 0 if t0 is None else bisect.bisect_left(self._t_ends, t0)
+        last = len(self.chunks) if t1 is None else bisect.bisect_right(self._t_starts, t1)
+
+        times, blocks = [], []
+        with open(self.path, "rb") as f:
+            for chunk in self.chunks[first:last]:
+                time, data = self._read_chunk(f, chunk, wanted)
+                times.append(time)
+                blocks.append(data)
+
+        if not times:
+            return np.empty(0), np.empty((len(wanted), 0))
+        time = np.concatenate(times)
+        data = np.hstack(blocks)
+        lo = 0 if t0 is None else np.searchsorted(time, t0, side="left")
+        hi = len(time) if t1 is None else np.searchsorted(time, t1, side="right")
+        return time[lo:hi], data[:, lo:hi]
+
+
+def write_store(path, time, data, columns, **options):
+    with StoreWriter(path, columns, **options) as writer:
+        writer.append(time, data)
+
+
+def csv_to_store(csv_path, store_path, channels=("FP1", "FP2"), **options):
+    eeg_data = pd.read_csv(csv_path, usecols=["Time (s)", *channels])
+    time = eeg_data["Time (s)"].to_numpy(dtype=np.float64)
+    data = eeg_data[list(channels)].to_numpy(dtype=np.float64).T
+    write_store(store_path, time, data, ["Time (s)", *channels], **options)
+
+
+# Size and read throughput of CSV, raw float32 and the column store
+def benchmark(csv_path, workdir=".", repeats=5):
+    eeg_data = pd.read_csv(csv_path, usecols=["Time (s)", "FP1", "FP2"])
+    time = eeg_data["Time (s)"].to_numpy(dtype=np.float64)
+    data = eeg_data[["FP1", "FP2"]].to_numpy(dtype=np.float64).T
+    n = len(time)
+
+    raw_path = os.path.join(workdir, "bench.f32")
+    store_path = os.path.join(workdir, "bench.eegz")
+    np.vstack([time, data]).astype(np.float32).tofile(raw_path)
+    write_store(store_path, time, data, ["Time (s)", "FP1", "FP2"], chunk_rows=1024)
+
+    def timed(read):
+        start = clock.perf_counter()
+        for _ in range(repeats):
+            read()
+        return (clock.perf_counter() - start) / repeats
+
+    mid = time[n // 2]
+    span = (time[-1] - time[0]) / 10
+    reader = StoreReader(store_path)
+    results = {
+        "csv": (os.path.getsize(csv_path), timed(lambda: pd.read_csv(csv_path, usecols=["Time (s)", "FP1", "FP2"]))),
+        "float32": (os.path.getsize(raw_path), timed(lambda: np.fromfile(raw_path, dtype=np.float32))),
+        "store": (os.path.getsize(store_path), timed(reader.read)),
+        "store (10% range)": (os.path.getsize(store_path), timed(lambda: reader.read(mid, mid + span))),
+    }
+    os.remove(raw_path)
+    os.remove(store_path)
+
+    for name, (size, seconds) in results.items():
+        print(f"{name:>18}: {size / 1024:9.1f} KiB  {1000 * seconds:8.3f} ms/read  {n / seconds / 1e6:8.2f} M rows/s of recording")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed column storage for EEG recordings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert")
+    convert.add_argument("csv_path")
+    convert.add_argument("store_path")
+    bench = subparsers.add_parser("bench")
+    bench.add_argument("csv_path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        csv_to_store(args.csv_path, args.store_path)
+    else:
+        benchmark(args.csv_path)
+
+
+if __name__ == "__main__":
+    main()
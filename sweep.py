@@ -0,0 +1,126 @@
+import argparse
+import os
+import time as clock
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from detection import DEFAULT_BASE_THRESHOLDS
+from filters import standard_chain
+from recording import load_recording
+from synthetic import SyntheticEEG
+
+
+# Number of events for every threshold range at once. An event starts at a
+# sample with |x - base| > r whose predecessor has |x - base| <= r, i.e.
+# for r in [dev[i - 1], dev[i]); counting interval starts and ends at or
+# below each r gives all the counts from two sorted arrays
+def event_counts(data, base, ranges):
+    deviation = np.abs(np.asarray(data, dtype=np.float64) - base)
+    previous = np.empty_like(deviation)
+    previous[0] = -np.inf
+    previous[1:] = deviation[:-1]
+    rising = previous < deviation
+    lo = np.sort(previous[rising])
+    hi = np.sort(deviation[rising])
+    ranges = np.asarray(ranges, dtype=np.float64)
+    return np.searchsorted(lo, ranges, side="right") - np.searchsorted(hi, ranges, side="right")
+
+
+# Samples flagged on each channel and on both, for every pair of ranges
+def flagged_counts(dev1, dev2, ranges1, ranges2):
+    # bucket j holds samples exceeding exactly the first j ranges
+    b1 = np.searchsorted(ranges1, dev1, side="left")
+    b2 = np.searchsorted(ranges2, dev2, side="left")
+    shape = (len(ranges1) + 1, len(ranges2) + 1)
+    joint = np.bincount(b1 * shape[1] + b2, minlength=shape[0] * shape[1]).reshape(shape)
+    # both[j, k] = samples with dev1 > ranges1[j] and dev2 > ranges2[k]
+    tail = joint[::-1, ::-1].cumsum(axis=0).cumsum(axis=1)[::-1, ::-1]
+    both = tail[1:, 1:]
+    n1 = tail[1:, 0]
+    n2 = tail[0, 1:]
+    return n1, n2, both
+
+
+class SweepResult:
+    """Event-count and agreement surfaces over (cutoff, FP1 range, FP2 range).
+
+    counts_fp1 is (cutoffs, ranges_fp1) and counts_fp2 is (cutoffs,
+    ranges_fp2). events is their sum and agreement the Jaccard index of the
+    two channels' flagged samples, both (cutoffs, ranges_fp1, ranges_fp2).
+    """
+
+    def __init__(self, cutoffs, ranges_fp1, ranges_fp2, counts_fp1, counts_fp2, agreement):
+        self.cutoffs = cutoffs
+        self.ranges_fp1 = ranges_fp1
+        self.ranges_fp2 = ranges_fp2
+        self.counts_fp1 = counts_fp1
+        self.counts_fp2 = counts_fp2
+        self.agreement = agreement
+
+    @property
+    def events(self):
+        return self.counts_fp1[:, :, None] + self.counts_fp2[:, None, :]
+
+    def best(self):
+        """(cutoff, FP1 range, FP2 range) with the highest channel agreement."""
+        i, j, k = np.unravel_index(np.nanargmax(self.agreement), self.agreement.shape)
+        return self.cutoffs[i], self.ranges_fp1[j], self.ranges_fp2[k]
+
+
+def sweep(raw, fs, cutoffs, ranges_fp1, ranges_fp2, base_thresholds=None, workers=None, **chain_options):
+    """Evaluate every (cutoff, FP1 range, FP2 range) combination.
+
+    Each cutoff is filtered once, in parallel across cutoffs. All threshold
+    combinations then come from that one filtered output.
+    """
+    bases = base_thresholds or DEFAULT_BASE_THRESHOLDS
+    cutoffs = np.asarray(cutoffs, dtype=np.float64)
+    ranges_fp1 = np.sort(np.asarray(ranges_fp1, dtype=np.float64))
+    ranges_fp2 = np.sort(np.asarray(ranges_fp2, dtype=np.float64))
+
+    def evaluate(cutoff):
+        fp1, fp2 = standard_chain(fs, cutoff, **chain_options).apply(raw)
+        dev1 = np.abs(fp1 - bases["FP1"])
+        dev2 = np.abs(fp2 - bases["FP2"])
+        n1, n2, both = flagged_counts(dev1, dev2, ranges_fp1, ranges_fp2)
+        union = n1[:, None] + n2[None, :] - both
+        with np.errstate(invalid="ignore", divide="ignore"):
+            agreement = np.where(union > 0, both / union, np.nan)
+        return (event_counts(fp1, bases["FP1"], ranges_fp1),
+                event_counts(fp2, bases["FP2"], ranges_fp2),
+                agreement)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        results = list(pool.map(evaluate, cutoffs))
+
+    return SweepResult(
+        cutoffs, ranges_fp1, ranges_fp2,
+        np.array([r[0] for r in results]),
+        np.array([r[1] for r in results]),
+        np.array([r[2] for r in results]),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep cutoff and threshold ranges over one recording.")
+    parser.add_argument("path", nargs="?", help="Recording to sweep; a synthetic 30-minute one if omitted")
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--cutoffs", type=int, default=100)
+    parser.add_argument("--ranges", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.path:
+        _, raw = load_recording(args.path)
+    else:
+        _, raw = SyntheticEEG(30 * 60, args.fs).generate()
+
+    cutoffs = np.linspace(1, min(100, 0.45 * args.fs), args.cutoffs)
+    ranges = np.linspace(50, 500, args.ranges)
+    start = clock.perf_counter()
+    result = sweep(raw, args.fs, cutoffs, ranges, ranges)
+    elapsed = clock.perf_counter() - start
+    print(f"{args.cutoffs} x {args.ranges} x {args.ranges} grid on {raw.shape[1]} samples in {elapsed:.2f} s")
+    print("Best agreement at cutoff %.1f Hz, FP1 ±%.0f, FP2 ±%.0f" % result.best())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import os
+import time as clock
+from collections import namedtuple
+import numpy as np
+from scipy.signal import lfilter
+from detection import DEFAULT_BASE_THRESHOLDS
+from recording import CHANNELS
+from storage import StoreWriter
+
+# Ground truth of injected blinks, in seconds; amplitude in μV. Blinks are
+# common to all channels, scaled by each channel's gain
+Blinks = namedtuple("Blinks", ["onset", "offset", "peak", "amplitude"])
+
+
+class SyntheticEEG:
+    """Arbitrarily long synthetic recording with known blinks.
+
+    Each channel is a DC offset plus noise of rms noise μV with a
+    1/f^alpha spectrum between 0.05 Hz and fs/4,
+    mains hum and blink waveforms. Blinks arrive as a Poisson process of
+    blink_rate per minute, never closer than gap seconds apart, each rising
+    over about 40% of its duration and decaying over the rest. Blocks are
+    generated on demand with filter state carried across them, so a
+    recording streams in constant memory and the same seed always gives
+    the same samples whatever the block size.
+    """
+
+    def __init__(self, seconds=60, fs=256, channels=CHANNELS, offsets=None, noise=20.0, alpha=1.0,
+                 mains=50.0, mains_amplitude=15.0, blink_rate=15.0, amplitude=(250.0, 600.0),
+                 duration=(0.2, 0.4), gap=0.3, gains=None, seed=0):
+        self.fs = float(fs)
+        self.rows = int(round(seconds * fs))
+        self.channels = tuple(channels)
+        if offsets is None:
+            offsets = [DEFAULT_BASE_THRESHOLDS.get(channel, 8000.0 if i % 2 == 0 else -8000.0)
+                       for i, channel in enumerate(self.channels)]
+        self.offsets = np.asarray(offsets, dtype=np.float64)[:, None]
+        self.gains = np.ones(len(self.channels)) if gains is None else np.asarray(gains, dtype=np.float64)
+        self.noise = noise
+        self.alpha = alpha
+        self.mains = mains if mains and mains < self.fs / 2 else None
+        self.mains_amplitude = mains_amplitude
+        self.seed = seed
+        self.blinks = self._draw_blinks(blink_rate, amplitude, duration, gap)
+
+    def _draw_blinks(self, rate, amplitude, duration, gap):
+        rng = np.random.default_rng([self.seed, 1])
+        seconds = self.rows / self.fs
+        expected = int(rate * seconds / 60 * 1.5) + 16
+        durations = rng.uniform(*duration, expected)
+        # Exponential waits after a dead time of the blink plus gap, which keeps
+        # blinks apart; the waits are shortened so the mean rate stays rate
+        wait = max(60 / rate - np.mean(duration) - gap, 0) if rate else np.inf
+        onsets = np.cumsum(rng.exponential(wait, expected) + np.concatenate([[0], durations[:-1]]) + gap)
+        keep = np.flatnonzero(onsets + durations < seconds)
+        onsets, durations = onsets[keep], durations[keep]
+        return Blinks(onsets, onsets + durations, onsets + 0.4 * durations,
+                      rng.uniform(*amplitude, len(keep)))
+
+    # Geometrically spaced first-order low-passes; weights proportional to
+    # corner^(1 - alpha) sum to a 1/f^alpha spectrum between the corners
+    def _noise_bank(self):
+        corners = np.geomspace(0.05, self.fs / 4, 8)
+        poles = np.exp(-2 * np.pi * corners / self.fs)
+        weights = corners ** ((1 - self.alpha) / 2) * np.sqrt(1 - poles ** 2)
+        weights *= self.noise / np.sqrt(np.sum(weights ** 2 / (1 - poles ** 2)))
+        return list(zip(poles, weights))
+
+    def blocks(self, block_rows=1 << 16):
+        """(time, data) blocks covering the recording, data shaped (channels, n)."""
+        rng = np.random.default_rng([self.seed, 2])
+        bank = self._noise_bank()
+        channels = len(self.channels)
+        # Each section starts in its stationary state and filters its own white noise
+        state = [pole * weight / np.sqrt(1 - pole ** 2) * rng.standard_normal((channels, 1)) for pole, weight in bank]
+        onset_rows = np.rint(self.blinks.onset * self.fs).astype(np.int64)
+        end_rows = np.rint(self.blinks.offset * self.fs).astype(np.int64)
+        for start in range(0, self.rows, block_rows):
+            stop = min(start + block_rows, self.rows)
+            index = np.arange(start, stop)
+            time = index / self.fs
+            data = np.repeat(self.offsets, len(index), axis=1)
+
+            # Drawn sample-major, so the stream does not depend on block_rows
+            white = rng.standard_normal((len(index), len(bank), channels)).transpose(1, 2, 0)
+            for k, (pole, weight) in enumerate(bank):
+                out, state[k] = lfilter([weight], [1, -pole], white[k], axis=-1, zi=state[k])
+                data += out
+
+            if self.mains is not None:
+                data += self.mains_amplitude * np.sin(2 * np.pi * self.mains * time)
+
+            self._add_blinks(data, start, stop, onset_rows, end_rows)
+            yield time, data
+
+    def _add_blinks(self, data, start, stop, onset_rows, end_rows):
+        first = np.searchsorted(end_rows, start, side="right")
+        last = np.searchsorted(onset_rows, stop, side="left")
+        if first >= last:
+            return
+        onsets, ends = onset_rows[first:last], end_rows[first:last]
+        lengths = ends - onsets
+        # Sample rows of every blink in the block, and each one's phase in [0, 1)
+        owner = np.repeat(np.arange(len(onsets)), lengths)
+        rows = onsets[owner] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        phase = (rows - onsets[owner]) / lengths[owner]
+        shape = np.where(phase < 0.4, 0.5 - 0.5 * np.cos(np.pi * phase / 0.4),
+                         0.5 + 0.5 * np.cos(np.pi * (phase - 0.4) / 0.6))
+        inside = (rows >= start) & (rows < stop)
+        wave = self.blinks.amplitude[first:last][owner[inside]] * shape[inside]
+        data[:, rows[inside] - start] += self.gains[:, None] * wave
+
+    def generate(self):
+        """The whole recording as (time, raw)."""
+        times, blocks = zip(*self.blocks())
+        return np.concatenate(times), np.hstack(blocks)
+
+    def thresholds(self, fraction=0.5):
+        """Threshold bands centred on each offset, fraction of the smallest blink wide on each side."""
+        half = fraction * (self.blinks.amplitude.min() if len(self.blinks.amplitude) else 0.0)
+        return {channel: (offset - gain * half, offset + gain * half)
+                for channel, offset, gain in zip(self.channels, self.offsets[:, 0], self.gains)}
+
+
+def write_csv(path, source, block_rows=1 << 16):
+    with open(path, "w") as f:
+        f.write(",".join(["Time (s)", *source.channels]) + "\n")
+        for time, data in source.blocks(block_rows):
+            np.savetxt(f, np.column_stack([time, data.T]), fmt=["%.6f"] + ["%.2f"] * len(source.channels),
+                       delimiter=",")
+
+
+def write_eegz(path, source, block_rows=1 << 16):
+    metadata = {"synthetic": {"fs": source.fs, "seed": source.seed}}
+    with StoreWriter(path, ["Time (s)", *source.channels], metadata=metadata) as writer:
+        for time, data in source.blocks(block_rows):
+            writer.append(time, data)
+
+
+# CSV or the compressed column store by extension; the blinks go to a
+# {name}_truth.npz sidecar
+def write_recording(path, source, block_rows=1 << 16):
+    if path.endswith(".eegz"):
+        write_eegz(path, source, block_rows)
+    else:
+        write_csv(path, source, block_rows)
+    save_truth(truth_path(path), source.blinks)
+
+
+def truth_path(path):
+    return os.path.splitext(path)[0] + "_truth.npz"
+
+
+def save_truth(path, blinks):
+    np.savez(path, **blinks._asdict())
+
+
+def load_truth(path):
+    with np.load(path) as f:
+        return Blinks(*(f[name] for name in Blinks._fields))
+
+
+def match_events(true_onsets, detected_onsets, tolerance=0.1):
+    """(hits, misses, false_alarms): detections within tolerance of a true onset.
+
+    Each true onset is matched at most once, to its nearest detection.
+    """
+    true_onsets = np.asarray(true_onsets, dtype=np.float64)
+    detected_onsets = np.asarray(detected_onsets, dtype=np.float64)
+    if not len(true_onsets) or not len(detected_onsets):
+        return 0, len(true_onsets), len(detected_onsets)
+    right = np.clip(np.searchsorted(detected_onsets, true_onsets), 1, len(detected_onsets) - 1)
+    left = right - 1
+    nearest = np.where(np.abs(detected_onsets[left] - true_onsets) <= np.abs(detected_onsets[right] - true_onsets),
+                       left, right)
+    if len(detected_onsets) == 1:
+        nearest = np.zeros(len(true_onsets), dtype=np.int64)
+    close = np.abs(detected_onsets[nearest] - true_onsets) <= tolerance
+    hits = len(np.unique(nearest[close]))
+    return hits, len(true_onsets) - hits, len(detected_onsets) - hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic recording with known blinks.")
+    parser.add_argument("path", help="Output .csv or .eegz; blinks go to {name}_truth.npz")
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--channels", nargs="+", default=list(CHANNELS))
+    parser.add_argument("--noise", type=float, default=20.0, help="rms of the 1/f noise (μV)")
+    parser.add_argument("--alpha", type=float, default=1.0, help="Noise spectrum exponent")
+    parser.add_argument("--mains", type=float, default=50.0, help="Mains frequency, 0 for none")
+    parser.add_argument("--blink-rate", type=float, default=15.0, help="Blinks per minute")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="Detect blinks in the output and score them")
+    args = parser.parse_args()
+
+    source = SyntheticEEG(args.minutes * 60, args.fs, args.channels, noise=args.noise, alpha=args.alpha,
+                          mains=args.mains, blink_rate=args.blink_rate, seed=args.seed)
+    start = clock.perf_counter()
+    write_recording(args.path, source)
+    elapsed = clock.perf_counter() - start
+    print(f"{source.rows} rows x {len(source.channels)} channels, {len(source.blinks.onset)} blinks "
+          f"in {elapsed:.2f} s ({source.rows / elapsed / 1e6:.2f} M rows/s)")
+
+    if args.check:
+        from detection import detect_events
+        from pipeline import PipelineConfig
+        from recording import load_recording
+
+        config = PipelineConfig(args.fs, notch=args.mains or None, thresholds=source.thresholds(),
+                                channels=source.channels)
+        time, raw = load_recording(args.path, config.channels)
+        filtered = config.apply(raw)
+        truth = load_truth(truth_path(args.path))
+        for row, channel in enumerate(config.channels):
+            onsets = detect_events(time, filtered[row], *config.thresholds[channel], config.refractory_samples())[0]
+            hits, misses, false_alarms = match_events(truth.onset, onsets)
+            print(f"{channel}: recall {hits / max(len(truth.onset), 1):.3f}, "
+                  f"precision {hits / max(len(onsets), 1):.3f} ({misses} missed, {false_alarms} false)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filters import (FLOAT32_TOLERANCE, FilterExecutor, high_pass_filter, low_pass_filter,
+                     precision_deviation, standard_chain)
+
+RECORDINGS = [os.path.join(ROOT, "eeg-data", name) for name in ("Ecog_waveform.csv", "Ecog_waveform_2.csv")]
+
+
+def load_channels(path):
+    return pd.read_csv(path)[["FP1", "FP2"]].to_numpy().T.copy()
+
+
+@pytest.fixture(params=RECORDINGS, ids=os.path.basename)
+def channels(request):
+    return load_channels(request.param)
+
+
+# Threaded and serial executors filter one row at a time; both must give the
+# same bits as the filter applied to the whole array
+@pytest.mark.parametrize("func, args, kwargs", [
+    (low_pass_filter, (30, 256), {}),
+    (high_pass_filter, (0.1, 250), {"order": 5}),
+], ids=["low-pass", "high-pass"])
+def test_executors_match_the_filter(channels, func, args, kwargs):
+    expected = func(channels, *args, **kwargs)
+    threaded = FilterExecutor(min_samples=0)
+    serial = FilterExecutor(max_workers=1)
+    try:
+        assert np.array_equal(threaded.apply(func, channels, *args, **kwargs), expected)
+        assert np.array_equal(serial.apply(func, channels, *args, **kwargs), expected)
+    finally:
+        threaded.shutdown()
+
+
+# The bundled recordings deviate by ~5e-4 μV, well inside the tolerance
+@pytest.mark.parametrize("chain", [
+    standard_chain(256, 30),
+    standard_chain(250, 5, dc_removal=True, notch=50, order=5),
+], ids=["default", "dc-notch"])
+def test_float32_stays_within_tolerance(channels, chain):
+    assert precision_deviation(channels, chain) <= FLOAT32_TOLERANCE
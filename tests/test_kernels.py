@@ -0,0 +1,81 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from detection import StreamingDetector, detect_blinks, detect_events
+from kernels import BACKENDS, detect, envelope
+
+CASES = [(seed, dtype) for seed in range(6) for dtype in (np.float64, np.float32)]
+
+
+def random_walk(seed, dtype, samples=5000):
+    rng = np.random.default_rng(seed)
+    data = np.cumsum(rng.normal(0, 30, samples)) + rng.normal(0, 60, samples)
+    lower, upper = np.percentile(data, [10 + 5 * seed, 90 - 5 * seed])
+    return data.astype(dtype), lower, upper
+
+
+@pytest.mark.parametrize("seed, dtype", CASES)
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backends_agree_with_numpy(seed, dtype, backend):
+    data, lower, upper = random_walk(seed, dtype)
+    for refractory in (0, 25):
+        expected = detect(data, lower, upper, refractory, backend="numpy")
+        actual = detect(data, lower, upper, refractory, backend=backend)
+        for name, a, b in zip(("starts", "ends", "peaks"), expected, actual):
+            assert np.array_equal(a, b), f"{backend} {name} with refractory {refractory}"
+    for window in (1, 33, 256):
+        assert np.array_equal(envelope(data, window, backend="numpy"), envelope(data, window, backend=backend))
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_edge_cases(backend):
+    inside = np.zeros(100)
+    outside = np.full(100, 10.0)
+    for data, count in ((inside, 0), (outside, 1), (np.empty(0), 0)):
+        starts, ends, peaks = detect(data, -1.0, 1.0, backend=backend)
+        assert len(starts) == len(ends) == len(peaks) == count
+    starts, ends, peaks = detect(outside, -1.0, 1.0, backend=backend)
+    assert (starts[0], ends[0], peaks[0]) == (0, 100, 0)
+
+
+# The detector splits runs, and the gaps merged across them, at block edges;
+# joined back up they must match one pass of the kernels over the channel
+@pytest.mark.parametrize("seed, dtype", CASES)
+@pytest.mark.parametrize("block", [1, 7, 256, 5000])
+@pytest.mark.parametrize("refractory", [0, 25])
+def test_streaming_detector_matches_kernels(seed, dtype, block, refractory):
+    data, lower, upper = random_walk(seed, dtype)
+    time = np.arange(len(data)) / 256.0
+    detector = StreamingDetector(lower, upper, refractory)
+    parts = [detector.feed(time[i:i + block], data[i:i + block]) for i in range(0, len(data), block)]
+    parts.append(detector.finish())
+    onsets, offsets, peaks = (np.concatenate([part[k] for part in parts]) for k in range(3))
+
+    starts, ends, peak_rows = detect(data, lower, upper, refractory)
+    assert np.array_equal(onsets, time[starts])
+    assert np.array_equal(offsets, time[ends - 1])
+    assert np.array_equal(peaks, np.abs(data[peak_rows] - 0.5 * (lower + upper)).astype(np.float64))
+    whole = detect_events(time, data, lower, upper, refractory)
+    assert all(np.array_equal(a, b) for a, b in zip((onsets, offsets, peaks), whole))
+
+
+# Chatter around a threshold: runs closer than the refractory period merge
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_refractory_merges_chatter(backend):
+    data = np.zeros(100)
+    data[[10, 11, 14, 15, 17, 60]] = 10.0
+    starts, ends, peaks = detect(data, -1.0, 1.0, refractory=5, backend=backend)
+    assert starts.tolist() == [10, 60] and ends.tolist() == [18, 61] and peaks.tolist() == [10, 60]
+    assert len(detect(data, -1.0, 1.0, backend=backend)[0]) == 4
+
+
+def test_blink_samples_are_the_runs():
+    data, lower, upper = random_walk(0, np.float64)
+    starts, ends, _ = detect(data, lower, upper)
+    rows = np.concatenate([np.arange(a, b) for a, b in zip(starts, ends)])
+    assert np.array_equal(detect_blinks(data, lower, upper), rows)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from detection import refractory_samples
+from segments import EventIndex, build_index
+from stats import SessionStats, iter_blocks
+
+FS = 256.0
+THRESHOLDS = {"FP1": (-100.0, 100.0), "FP2": (-100.0, 100.0)}
+
+
+# One 300 ms blink on FP1 whose middle dips back inside the band for 20 ms,
+# and a second blink two seconds later
+def chattering_blink():
+    time = np.arange(int(5 * FS)) / FS
+    filtered = np.zeros((2, len(time)))
+    for onset in (1.0, 3.0):
+        blink = (time >= onset) & (time < onset + 0.3)
+        filtered[0, blink] = 400.0
+    dip = (time >= 1.14) & (time < 1.16)
+    filtered[0, dip] = 50.0
+    return time, filtered
+
+
+def test_a_blink_with_a_dip_is_one_entry():
+    time, filtered = chattering_blink()
+    refractory = refractory_samples(0.2, FS)
+
+    # As Stage 2 builds it, from the statistics pass, in small blocks
+    stats = SessionStats(THRESHOLDS, refractory).feed_blocks(iter_blocks(time, filtered, 64))
+    index = EventIndex.from_events(stats.events(), list(THRESHOLDS))
+    assert len(index) == 2
+    assert np.allclose(index.onsets, [1.0, 3.0])
+    assert index.next_event(1.05) == 1
+
+    assert np.array_equal(build_index(time, filtered, THRESHOLDS, list(THRESHOLDS), refractory).onsets,
+                          index.onsets)
+    # Without the refractory period the dip splits the first blink
+    assert len(build_index(time, filtered, THRESHOLDS, list(THRESHOLDS))) == 3
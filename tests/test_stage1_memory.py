@@ -0,0 +1,106 @@
+import os
+import sys
+import time as clock
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+
+from cache import ResultCache
+from eeg_blink import Stage1
+from workspace import Workspace
+
+FS = 256
+ROWS = 5 * 60 * FS
+CUTOFFS = range(10, 41, 5)
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def stage1(app, tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    workspace = Workspace(fs=FS, cache=cache)
+    stage = Stage1(None, None, FS, "test", "today", QtWidgets.QStackedWidget(), cache=cache, workspace=workspace)
+    time = np.arange(ROWS) / FS
+    raw = np.random.default_rng(0).normal(size=(2, ROWS)) + np.array([[8000.0], [-8000.0]])
+    stage.load_data(time, raw, FS, source_key="test-recording")
+    yield stage
+    workspace.shutdown()
+    stage.executor.shutdown()
+
+
+def settle(app, stage, timeout=30):
+    deadline = clock.perf_counter() + timeout
+    while stage.filter_job is not None:
+        assert clock.perf_counter() < deadline, "filtering did not finish"
+        app.processEvents()
+        clock.sleep(0.005)
+    app.processEvents()
+
+
+def set_cutoff(app, stage, cutoff):
+    stage.slider.setValue(cutoff)
+    stage.update_plot()
+    settle(app, stage)
+
+
+def step_memory(app, stage, cutoffs):
+    """(growth, worst step peak) in bytes traced over slider steps to cutoffs.
+
+    The first step only replaces what was allocated before tracing started
+    and is not measured.
+    """
+    tracemalloc.start()
+    try:
+        set_cutoff(app, stage, cutoffs[0])
+        before = tracemalloc.get_traced_memory()[0]
+        worst = 0
+        for cutoff in cutoffs[1:]:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            set_cutoff(app, stage, cutoff)
+            worst = max(worst, tracemalloc.get_traced_memory()[1] - current)
+        return tracemalloc.get_traced_memory()[0] - before, worst
+    finally:
+        tracemalloc.stop()
+
+
+# Slider steps between cached results copy into Stage 1's buffer and update
+# the lines in place. Matplotlib copies each line's data when it is set and
+# redrawn (about two recordings' worth); nothing else may be allocated, and
+# less than one channel's worth kept from one step to the next
+def test_cached_slider_steps_reuse_the_buffers(app, stage1):
+    for cutoff in CUTOFFS:
+        set_cutoff(app, stage1, cutoff)
+    buffer = stage1.filtered
+
+    growth, worst = step_memory(app, stage1, list(CUTOFFS) * 2)
+
+    assert stage1.filtered is buffer
+    assert growth < stage1.raw.nbytes // 2, f"{growth} B kept over {2 * len(CUTOFFS) - 1} cached steps"
+    assert worst < 3 * stage1.raw.nbytes, f"{worst} B peak in a cached step"
+
+
+# A step that filters also allocates the result and the filter's scratch.
+# Only the results the chain runner keeps, and the newest entry the cache
+# keeps even over its limit, may stay allocated; no DataFrame or other copy
+# of the recording
+def test_filtering_steps_are_bounded(app, stage1):
+    settle(app, stage1)
+    stage1.cache.max_bytes = 0  # Nothing retained in memory, so each step filters
+    stage1.cache.cache_dir = None
+
+    growth, worst = step_memory(app, stage1, (12, 17, 22, 27, 32))
+
+    kept = (stage1.runner.max_results + 1) * stage1.raw.nbytes
+    assert growth < kept + stage1.raw.nbytes // 4, f"{growth} B kept over 4 filtering steps"
+    assert worst < 6 * stage1.raw.nbytes, f"{worst} B peak in a filtering step"
@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from traces import minmax_decimate
+
+
+# Peaks of the two channels fall in different buckets; each must be plotted
+# at its own sample time, not at the other channel's
+def test_each_channel_keeps_its_own_times():
+    time = np.arange(1000) / 256.0
+    data = np.zeros((2, 1000))
+    data[0, 123] = 5.0
+    data[1, 871] = -7.0
+
+    t, decimated = minmax_decimate(time, data, max_points=100)
+
+    assert t.shape == decimated.shape == (2, 100)
+    for row, sample in ((0, 123), (1, 871)):
+        peak = np.argmax(np.abs(decimated[row]))
+        assert decimated[row, peak] == data[row, sample]
+        assert t[row, peak] == time[sample]
+    assert all(np.all(np.diff(times) >= 0) for times in t)
+
+
+def test_short_traces_are_not_decimated():
+    time = np.arange(50) / 256.0
+    data = np.ones((2, 50))
+    t, decimated = minmax_decimate(time, data, max_points=100)
+    assert np.array_equal(decimated, data)
+    assert t.shape == (2, 50) and np.array_equal(t[1], time)
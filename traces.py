@@ -0,0 +1,41 @@
+import numpy as np
+
+
+# One row of sample times per channel; a shared time axis is repeated as a view
+def channel_times(time, rows):
+    time = np.asarray(time)
+    return np.broadcast_to(time, (rows, time.shape[-1]))
+
+
+# Min/max envelope of each row with at most max_points samples per row, so
+# the decimated trace keeps every peak the full-resolution one has. Returns
+# one row of times per channel, since each row keeps its own samples
+def minmax_decimate(time, data, max_points=2000):
+    time = np.asarray(time)
+    data = np.atleast_2d(data)
+    n = data.shape[-1]
+    buckets = max_points // 2
+    if n <= max_points or buckets < 1:
+        return channel_times(time, len(data)), data
+
+    # Whole buckets of size samples, then the remainder as one shorter bucket
+    size = -(-n // buckets)
+    full = n // size
+    blocks = data[:, :full * size].reshape(data.shape[0], full, size)
+    lo = blocks.argmin(axis=-1)
+    hi = blocks.argmax(axis=-1)
+    offsets = np.arange(full) * size
+    if full * size < n:
+        tail = data[:, full * size:]
+        lo = np.column_stack([lo, tail.argmin(axis=-1)])
+        hi = np.column_stack([hi, tail.argmax(axis=-1)])
+        offsets = np.append(offsets, full * size)
+
+    # Keep each bucket's min and max in time order
+    first = np.minimum(lo, hi)
+    second = np.maximum(lo, hi)
+    idx = np.empty((data.shape[0], 2 * len(offsets)), dtype=np.intp)
+    idx[:, 0::2] = offsets + first
+    idx[:, 1::2] = offsets + second
+
+    return time[idx], np.take_along_axis(data, idx, axis=-1)
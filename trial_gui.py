@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import messagebox
 import pandas as pd
 import numpy as np
-from scipy.signal import butter, filtfilt
+from filters import ChainRunner, FilterChain, FilterExecutor
 
 # Load EEG data
 eeg_data = pd.read_csv('Ecog_waveform_2.csv')
@@ -13,23 +13,11 @@ channel2 = eeg_data['FP2']
 # Sampling frequency (estimated from time difference)
 fs = 250
 
-# High-pass filter for DC removal
-def highpass_filter(data, cutoff, fs, order=5):
-    nyquist = 0.5 * fs  # Nyquist frequency
-    normal_cutoff = cutoff / nyquist  # Normalized cutoff frequency
-    b, a = butter(order, normal_cutoff, btype='high', analog=False)  # Butterworth filter coefficients
-    return filtfilt(b, a, data)
-
-# Low-pass Butterworth filter for denoising
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = butter(order, normal_cutoff, btype='low', analog=False)
-    return filtfilt(b, a, data)
-
-# DC removal for both channels
-channel_1_dcr = highpass_filter(channel1, 0.1, fs)
-channel_2_dcr = highpass_filter(channel2, 0.1, fs)
+# DC removal for both channels; cutoff changes apply DC removal and the
+# low-pass together as one fused cascade
+dc_chain = FilterChain(fs).highpass(0.1, 5)
+runner = ChainRunner([channel1, channel2], fs, executor=FilterExecutor())
+channel_1_dcr, channel_2_dcr = runner.run(dc_chain)
 
 
 class NeuroGameApp:
@@ -121,8 +109,7 @@ class NeuroGameApp:
                 canvas_fp2.delete(line)
 
             # Apply low-pass filter to both channels
-            filtered_channel_1 = butter_lowpass_filter(channel_1_dcr, cutoff, fs)
-            filtered_channel_2 = butter_lowpass_filter(channel_2_dcr, cutoff, fs)
+            filtered_channel_1, filtered_channel_2 = runner.run(dc_chain.lowpass(cutoff, 5))
 
             # Plot new filtered signals
             def plot_filtered(canvas, signal_data, color, scale_factor_y):
@@ -0,0 +1,376 @@
+import argparse
+import heapq
+import itertools
+import os
+import threading
+import time as clock
+from cache import ResultCache, file_hash, make_key
+from detection import detect_blinks, threshold_range
+from figures import render_png, thumbnail_figure
+from filters import max_cutoff, standard_chain
+from memory import cache_budget, default_budget, estimate_footprint, load_planned, plan_load
+from recording import CHANNELS, sample_dtype
+from traces import minmax_decimate
+
+
+# Job priorities; lower values run first
+VISIBLE, PREFETCH, BACKGROUND = 0, 1, 2
+
+# Work done for every file in a workspace, in order
+STEPS = ("load", "filter", "detect", "thumbnail")
+
+
+class Job:
+    """One unit of background work submitted to a JobQueue."""
+
+    def __init__(self, func, priority, group=None, name="", callback=None):
+        self.func = func
+        self.priority = priority
+        self.group = group
+        self.name = name
+        self.callback = callback
+        self.state = "pending"  # then running, done, failed or cancelled
+        self.result = None
+        self.error = None
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+
+class JobQueue:
+    """Priority queue of jobs served by a few worker threads.
+
+    Jobs with equal priority run in submission order. Pending jobs can be
+    reprioritized or cancelled by group; a running job always finishes.
+    Workers start on the first submit.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self.submitted = 0
+        self.completed = 0
+
+    def submit(self, func, priority=BACKGROUND, group=None, name="", callback=None):
+        job = Job(func, priority, group, name, callback)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("job queue is shut down")
+            heapq.heappush(self._heap, [priority, next(self._order), job])
+            self.submitted += 1
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if not self._heap:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                if job.state != "pending":
+                    continue
+                job.state = "running"
+            try:
+                job.result = job.func()
+                job.state = "done"
+            except Exception as e:
+                job.error = e
+                job.state = "failed"
+            self._finish(job)
+
+    def _finish(self, job):
+        with self._cond:
+            self.completed += 1
+        job._finished.set()
+        if job.callback is not None:
+            job.callback(job)
+
+    def set_priority(self, group, priority):
+        with self._cond:
+            for entry in self._heap:
+                if entry[2].group == group:
+                    entry[0] = entry[2].priority = priority
+            heapq.heapify(self._heap)
+
+    def cancel(self, group=None):
+        """Cancel pending jobs of one group, or all of them; returns how many."""
+        cancelled = []
+        with self._cond:
+            for entry in self._heap:
+                job = entry[2]
+                if job.state == "pending" and (group is None or job.group == group):
+                    job.state = "cancelled"
+                    cancelled.append(job)
+            self._heap = [entry for entry in self._heap if entry[2].state == "pending"]
+            heapq.heapify(self._heap)
+        for job in cancelled:
+            self._finish(job)
+        return len(cancelled)
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def progress(self):
+        with self._cond:
+            return self.completed, self.submitted
+
+    def shutdown(self, wait=True):
+        self.cancel()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class WorkspaceFile:
+    """Background processing state of one recording in a Workspace."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.source = None
+        self.plan = None  # How the file is loaded within the memory budget
+        self.fs = None  # Sample rate of the loaded samples, lower when averaged
+        self.steps_done = 0
+        self.job = None
+        self.reload = None  # Reloads samples evicted from the cache after the load step
+        self.error = None
+        self.cancelled = False
+        self.thumbnail = None
+
+    @property
+    def finished(self):
+        return self.steps_done == len(STEPS) or self.error is not None or self.cancelled
+
+    def status(self):
+        if self.error is not None:
+            return f"failed: {self.error}"
+        if self.cancelled:
+            return "cancelled"
+        if self.steps_done == len(STEPS):
+            return "ready"
+        if self.job is not None and self.job.state == "running":
+            return f"{STEPS[self.steps_done]}ing"
+        return "queued"
+
+
+class Workspace:
+    """Several open recordings processed in the background.
+
+    Each file is loaded, filtered with the default chain, scanned for blinks
+    with the default thresholds and rendered to a thumbnail. Results go into
+    the shared cache under the same keys the stages use, so opening a file
+    that has been processed is a cache hit. The focused file runs first and
+    the one after it is prefetched next. The cache takes its share of the
+    memory budget and each file is planned against what is left.
+    """
+
+    def __init__(self, paths=(), fs=256, cutoff=30, cache=None, queue=None, thresholds=None, budget=None):
+        self.fs = fs
+        self.budget = budget if budget is not None else default_budget()
+        self.cutoff = cutoff
+        self.cache = cache if cache is not None else ResultCache(max_bytes=cache_budget(self.budget))
+        self.queue = queue if queue is not None else JobQueue()
+        self.thresholds = thresholds or {channel: threshold_range(channel) for channel in CHANNELS}
+        self.files = []
+        self.current = 0
+        self._lock = threading.Lock()
+        self.add(paths)
+
+    def add(self, paths):
+        start = len(self.files)
+        self.files.extend(WorkspaceFile(path) for path in paths)
+        for index in range(start, len(self.files)):
+            self._schedule(index)
+
+    def _priority(self, index):
+        if index == self.current:
+            return VISIBLE
+        if index == self.current + 1:
+            return PREFETCH
+        return BACKGROUND
+
+    def focus(self, index):
+        """Make index the visible file; reprioritize every file's pending work."""
+        self.current = index
+        entry = self.files[index]
+        if entry.cancelled:
+            # Showing a cancelled file resumes its work
+            entry.cancelled = False
+            self._schedule(index)
+        for i, entry in enumerate(self.files):
+            self.queue.set_priority(entry, self._priority(i))
+
+    def _schedule(self, index):
+        entry = self.files[index]
+        with self._lock:
+            if entry.finished or (entry.job is not None and not entry.job.finished):
+                return
+            step = STEPS[entry.steps_done]
+            try:
+                entry.job = self.queue.submit(
+                    lambda: self._run_step(entry, step),
+                    self._priority(index),
+                    group=entry,
+                    name=f"{step} {entry.name}",
+                    callback=lambda job: self._step_finished(index, job),
+                )
+            except RuntimeError:
+                # The queue was shut down while an earlier step ran
+                entry.cancelled = True
+
+    def _step_finished(self, index, job):
+        entry = self.files[index]
+        if job.state == "done":
+            entry.steps_done += 1
+            self._schedule(index)
+        elif job.state == "failed":
+            entry.error = job.error
+        elif job.state == "cancelled":
+            entry.cancelled = True
+
+    def raw_key(self, entry):
+        return make_key("raw", entry.source, sample_dtype().__name__, entry.plan.strategy, entry.plan.factor)
+
+    def _raw(self, entry):
+        return self.cache.get_or_compute(self.raw_key(entry),
+                                         lambda: load_planned(entry.path, entry.plan, self.fs)[:2])
+
+    def _filtered(self, entry):
+        time, raw = self._raw(entry)
+        chain = standard_chain(entry.fs, min(self.cutoff, max_cutoff(entry.fs)))
+        key = make_key("filtered", entry.source, raw.dtype.name, entry.fs, chain.stages)
+        return time, self.cache.get_or_compute(key, lambda: chain.apply(raw)), key
+
+    def _run_step(self, entry, step):
+        if step == "load":
+            entry.source = file_hash(entry.path)
+            footprint = estimate_footprint(entry.path)
+            with self._lock:
+                entry.plan = plan_load(footprint, self.remaining_budget())
+            entry.fs = self.fs / entry.plan.factor
+            self._raw(entry)
+        elif step == "filter":
+            self._filtered(entry)
+        elif step == "detect":
+            time, filtered, key = self._filtered(entry)
+            for row, channel in enumerate(CHANNELS):
+                lower, upper = self.thresholds[channel]
+                self.cache.get_or_compute(make_key("events", key, row, lower, upper),
+                                          lambda: detect_blinks(filtered[row], lower, upper))
+        elif step == "thumbnail":
+            time, filtered, key = self._filtered(entry)
+            entry.thumbnail = self.cache.get_or_compute(
+                make_key("thumbnail", key),
+                lambda: render_png(thumbnail_figure(*minmax_decimate(time, filtered, 400)), dpi=40),
+            )
+
+    def remaining_budget(self):
+        """Bytes of the budget not held by the cache or by files already planned."""
+        planned = sum(entry.plan.footprint.total(entry.plan.strategy, entry.plan.factor)
+                      for entry in self.files if entry.plan is not None and entry.error is None)
+        return max(self.budget - self.cache.max_bytes - planned, 0)
+
+    def recording(self, index):
+        """(time, raw, source, fs) of a loaded file, or None while it is still loading.
+
+        Safe to poll from the GUI thread: it never loads. Samples that have
+        left the in-memory cache are reloaded by a visible-priority job, and
+        None is returned until that job is done.
+        """
+        entry = self.files[index]
+        if entry.steps_done < 1:
+            return None
+        samples = self.cache.peek(self.raw_key(entry))
+        if samples is None:
+            samples = self._reloaded(entry)
+            if samples is None:
+                return None
+        else:
+            entry.reload = None  # Its result is not kept alive past the cache
+        time, raw = samples
+        return time, raw, entry.source, entry.fs
+
+    def _reloaded(self, entry):
+        with self._lock:
+            job = entry.reload
+            if job is None or job.state == "cancelled":
+                try:
+                    entry.reload = self.queue.submit(lambda: self._raw(entry), VISIBLE, group=entry,
+                                                     name=f"reload {entry.name}")
+                except RuntimeError:
+                    pass  # Shut down; nothing will load
+                return None
+            if not job.finished:
+                return None
+            entry.reload = None
+        if job.state == "failed":
+            entry.error = job.error
+            return None
+        return job.result
+
+    def progress(self):
+        """Fraction of all files' steps that have finished."""
+        if not self.files:
+            return 1.0
+        done = sum(len(STEPS) if entry.finished else entry.steps_done for entry in self.files)
+        return done / (len(STEPS) * len(self.files))
+
+    def cancel(self, index=None):
+        """Stop background work for one file, or every file but the visible one."""
+        indices = [index] if index is not None else [i for i in range(len(self.files)) if i != self.current]
+        for i in indices:
+            entry = self.files[i]
+            with self._lock:
+                if not entry.finished:
+                    entry.cancelled = True
+            self.queue.cancel(entry)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        while not all(entry.finished for entry in self.files):
+            if deadline is not None and clock.monotonic() > deadline:
+                return False
+            clock.sleep(0.01)
+        return True
+
+    def shutdown(self):
+        self.queue.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process several recordings in the background.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    start = clock.perf_counter()
+    workspace = Workspace(args.paths, queue=JobQueue(args.workers))
+    while not workspace.wait(timeout=0.5):
+        print(f"{100 * workspace.progress():.0f}% done")
+    for entry in workspace.files:
+        print(f"{entry.name}: {entry.status()}")
+    print(f"Processed {len(workspace.files)} files in {clock.perf_counter() - start:.2f} s")
+    workspace.shutdown()
+
+
+if __name__ == "__main__":
+    main()